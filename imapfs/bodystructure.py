@@ -0,0 +1,386 @@
+"""IMAP response and BODYSTRUCTURE parsing."""
+
+from __future__ import annotations
+
+import binascii
+import contextlib
+import copy
+import email.message
+import itertools
+import re
+from typing import TYPE_CHECKING, Any
+
+from imap_tools.folder import FolderInfo
+from imap_tools.imap_utf7 import utf7_decode
+from imap_tools.message import MailAttachment, MailMessage
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from datetime import datetime
+
+TOKEN_PATTERN = re.compile(
+    rb"""
+    \s*(?:
+        (?P<open>\()
+        | (?P<close>\))
+        | "(?P<quoted>(?:[^"\\]|\\.)*)"
+        | (?P<atom>
+            # names may start with a bracket (e.g. [Gmail]/Spam)
+            \[[^\]\s()"]*\][^\s()"]*
+            | [^\s()"\[]+(?:\[[^\]]*\](?:<\d+>)?)?
+        )
+    )
+    """,
+    re.VERBOSE,
+)
+
+LITERAL_PATTERN = re.compile(rb"~?\{\d+\}")
+
+
+class AttachmentPart:
+    """Attachment described by a message BODYSTRUCTURE."""
+
+    __slots__ = ("encoding", "filename", "section", "size")
+
+    def __init__(self, section: str, filename: str, size: int, encoding: str) -> None:
+        """Initialise attachment part.
+
+        Args:
+            section: MIME section number of the part (e.g. `2` or `3.1`)
+            filename: attachment filename
+            size: decoded attachment size in bytes
+            encoding: part content transfer encoding
+        """
+        self.section = section
+        self.filename = filename
+        self.size = size
+        self.encoding = encoding
+
+
+class MessageStructure:
+    """Message metadata and attachments, without any message content."""
+
+    __slots__ = ("attachments", "date", "uid")
+
+    def __init__(
+        self,
+        uid: str,
+        date: datetime,
+        attachments: list[AttachmentPart],
+    ) -> None:
+        """Initialise message structure.
+
+        Args:
+            uid: message UID
+            date: message date
+            attachments: message attachments
+        """
+        self.uid = uid
+        self.date = date
+        self.attachments = attachments
+
+
+def parse_fetch_response(data: list) -> list[dict[str, Any]]:
+    """Parse untagged FETCH response data, as returned by `imaplib`.
+
+    Args:
+        data: FETCH response data
+
+    Returns:
+        Data items of each message, keyed by upper-case item name. Lists are parsed
+        to lists, `NIL` to `None`, and any other value is left as bytes.
+    """
+    tokens = _tokenize(data)
+    messages = []
+
+    # each message is "<sequence number> (<name> <value> ...)"
+    for _ in tokens:
+        items = _parse_value(next(tokens), tokens)
+        messages.append(
+            {
+                items[i].decode().upper(): items[i + 1]
+                for i in range(0, len(items) - 1, 2)
+            }
+        )
+
+    return messages
+
+
+def parse_list_response(data: list) -> list[FolderInfo]:
+    """Parse untagged LIST response data, as returned by `imaplib`.
+
+    Args:
+        data: LIST response data
+
+    Returns:
+        Listed folders.
+    """
+    folders = []
+
+    for response in _iter_responses(data):
+        # each folder is "(<flags>) <delimiter> <name> [<extended data>]"
+        flags, delim, name, *_ = _parse_values(response)
+        folders.append(
+            FolderInfo(
+                name=utf7_decode(name),
+                delim=_decode(delim),
+                flags=tuple(_decode(flag) for flag in flags),
+            )
+        )
+
+    return folders
+
+
+def parse_status_response(data: list) -> dict[str, dict[str, int]]:
+    """Parse untagged STATUS response data, as returned by `imaplib`.
+
+    Args:
+        data: STATUS response data
+
+    Returns:
+        Status items of each folder, keyed by folder name.
+    """
+    statuses = {}
+
+    for response in _iter_responses(data):
+        # each folder is "<name> (<name> <value> ...)"
+        name, items = _parse_values(response)
+        statuses[utf7_decode(name)] = {
+            _decode(items[i]).upper(): int(items[i + 1])
+            for i in range(0, len(items) - 1, 2)
+        }
+
+    return statuses
+
+
+def iter_attachment_parts(
+    bodystructure: list,
+) -> Iterator[tuple[str, email.message.Message]]:
+    """Iterate over parts of a message BODYSTRUCTURE that are attachments.
+
+    Parts are considered attachments on the same basis as
+    `imap_tools.message.MailMessage.attachments`.
+
+    Args:
+        bodystructure: parsed BODYSTRUCTURE
+
+    Yields:
+        Section number and an empty message carrying the part headers.
+    """
+    for section, _, part in _iter_attachment_bodies(bodystructure):
+        yield section, part
+
+
+def get_message_structure(
+    item: dict[str, Any],
+    sizes: dict[str, int],
+) -> MessageStructure:
+    """Build a message structure from fetched data items.
+
+    Args:
+        item: data items fetched for the message, including `UID`, `BODYSTRUCTURE`
+            and the `Date` header
+        sizes: decoded size of each attachment, by section number. Attachments
+            missing from it are sized from the BODYSTRUCTURE instead.
+
+    Returns:
+        Message structure.
+    """
+    header = next((v for k, v in item.items() if k.startswith("BODY[HEADER")), b"")
+    attachments = []
+
+    for section, body, part in _iter_attachment_bodies(item["BODYSTRUCTURE"]):
+        encoding = part.get("Content-Transfer-Encoding", "7bit").lower()
+        size = sizes.get(section)
+
+        if size is None:
+            size = _encoded_size(body, encoding)
+
+        attachments.append(
+            AttachmentPart(section, MailAttachment(part).filename, size, encoding)
+        )
+
+    return MessageStructure(
+        item["UID"].decode(),
+        MailMessage.from_bytes(header or b"").date,
+        attachments,
+    )
+
+
+def get_part_payload(part: email.message.Message, data: bytes) -> bytes:
+    """Decode fetched part content, as `imap_tools.message.MailAttachment.payload`.
+
+    Args:
+        part: part headers, from `iter_attachment_parts`
+        data: part content, as fetched with `BODY[<section>]`
+
+    Returns:
+        Decoded part content.
+    """
+    encoding = part.get("Content-Transfer-Encoding", "7bit").lower()
+
+    # decode the common encodings straight from bytes, rather than going through
+    # a string payload
+    if encoding in ("7bit", "8bit", "binary"):
+        return data
+
+    if encoding == "quoted-printable":
+        return binascii.a2b_qp(data)
+
+    if encoding == "base64":
+        with contextlib.suppress(binascii.Error):
+            return binascii.a2b_base64(data)
+
+    # malformed base64 and other encodings are decoded as leniently as `email` does,
+    # on a copy so the part headers can be reused
+    part = copy.copy(part)
+    part.set_payload(data.decode("ascii", "surrogateescape"))
+    return part.get_payload(decode=True)
+
+
+def _tokenize(data: list) -> Iterator[tuple[str, Any]]:
+    for item in data:
+        if isinstance(item, tuple):
+            text, literal = item
+        else:
+            text, literal = item, None
+
+        for match in TOKEN_PATTERN.finditer(text or b""):
+            kind = match.lastgroup
+            value = match[kind]
+
+            if (
+                kind == "atom"
+                and literal is not None
+                and LITERAL_PATTERN.fullmatch(value)
+            ):
+                yield "literal", literal
+            elif kind == "quoted":
+                yield kind, re.sub(rb"\\(.)", rb"\1", value)
+            else:
+                yield kind, value
+
+
+def _iter_responses(data: list) -> Iterator[list]:
+    # literals are followed by the rest of their response line
+    response = []
+
+    for item in data:
+        if item is None:
+            continue
+
+        response.append(item)
+
+        if not isinstance(item, tuple):
+            yield response
+            response = []
+
+    if response:
+        yield response
+
+
+def _parse_values(data: list) -> list:
+    tokens = _tokenize(data)
+    return [_parse_value(token, tokens) for token in tokens]
+
+
+def _parse_value(token: tuple[str, Any], tokens: Iterator[tuple[str, Any]]):
+    kind, value = token
+
+    if kind == "open":
+        values = []
+
+        for child in tokens:
+            if child[0] == "close":
+                break
+
+            values.append(_parse_value(child, tokens))
+
+        return values
+
+    if kind == "atom" and value.upper() == b"NIL":
+        return None
+
+    return value
+
+
+def _iter_parts(body: list, section: tuple[int, ...] = (), *, root=True):
+    if isinstance(body[0], list):
+        # child parts come before the multipart subtype
+        children = itertools.takewhile(lambda child: isinstance(child, list), body)
+
+        for i, child in enumerate(children, start=1):
+            yield from _iter_parts(child, (*section, i), root=False)
+
+        return
+
+    # a non-multipart message body is section 1 of that message
+    section = (*section, 1) if root else section
+    yield ".".join(map(str, section)), body
+
+    if _decode(body[0]).lower() == "message" and _decode(body[1]).lower() == "rfc822":
+        yield from _iter_parts(body[8], section)
+
+
+def _iter_attachment_bodies(bodystructure: list):
+    for section, body in _iter_parts(bodystructure):
+        part = _part_headers(body)
+
+        if (
+            part.get("Content-ID") is None
+            and part.get_filename() is None
+            and part.get_content_type() != "message/rfc822"
+        ):
+            continue
+
+        yield section, body, part
+
+
+def _encoded_size(body: list, encoding: str) -> int:
+    # the BODYSTRUCTURE only has the size of the encoded content, which base64
+    # inflates by a third
+    size = int(body[6] or 0)
+    return size * 3 // 4 if encoding == "base64" else size
+
+
+def _part_headers(body: list) -> email.message.Message:
+    part = email.message.Message()
+    part["Content-Type"] = f"{_decode(body[0])}/{_decode(body[1])}".lower()
+    _set_params(part, "Content-Type", body[2])
+
+    if body[3]:
+        part["Content-ID"] = _decode(body[3])
+
+    if body[5]:
+        part["Content-Transfer-Encoding"] = _decode(body[5])
+
+    # extension data follows the basic fields, and the type-specific fields of text
+    # and message/rfc822 parts
+    if part.get_content_maintype() == "text":
+        extension = body[8:]
+    elif part.get_content_type() == "message/rfc822":
+        extension = body[10:]
+    else:
+        extension = body[7:]
+
+    disposition = extension[1] if len(extension) > 1 else None
+
+    if isinstance(disposition, list):
+        part["Content-Disposition"] = _decode(disposition[0]).lower()
+        _set_params(part, "Content-Disposition", disposition[1])
+    elif disposition:
+        # some servers send the raw header value
+        part["Content-Disposition"] = _decode(disposition)
+
+    return part
+
+
+def _set_params(part: email.message.Message, header: str, params: list | None):
+    params = params or []
+
+    for i in range(0, len(params) - 1, 2):
+        part.set_param(_decode(params[i]), _decode(params[i + 1]), header=header)
+
+
+def _decode(value: bytes | None) -> str:
+    return (value or b"").decode(errors="replace")
@@ -2,32 +2,460 @@
 
 from __future__ import annotations
 
+import atexit
+import contextlib
 import fnmatch
-import io
+import functools
+import hashlib
 import itertools
+import os
+import queue
 import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from glob import has_magic
 from imaplib import IMAP4
-from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
 from fsspec import AbstractFileSystem
-from imap_tools import AND, MailBox
-from imap_tools.errors import MailboxFolderSelectError
+from fsspec.spec import AbstractBufferedFile
+from fsspec.utils import glob_translate
+from imap_tools import AND, OR, H, MailBox
+from imap_tools.errors import (
+    MailboxFetchError,
+    MailboxFolderSelectError,
+    MailboxTaggedResponseError,
+    MailboxUidsError,
+)
+from imap_tools.folder import encode_folder
+from imap_tools.message import MailAttachment, MailMessage
+from imap_tools.utils import check_command_status, chunked
 from typing_extensions import override
 
+from imapfs.bodystructure import (
+    AttachmentPart,
+    get_message_structure,
+    get_part_payload,
+    iter_attachment_parts,
+    parse_fetch_response,
+    parse_list_response,
+    parse_status_response,
+)
+
 if TYPE_CHECKING:
-    from imap_tools.message import MailMessage
+    from collections.abc import Callable, Iterable, Iterator
+    from datetime import date, datetime
+    from email.message import Message
+
+    from imap_tools.folder import FolderInfo
+
+FETCH_OPTIONS = frozenset(
+    {
+        "charset",
+        "limit",
+        "mark_seen",
+        "reverse",
+        "headers_only",
+        "bulk",
+        "sort",
+        "since",
+    }
+)
+
+# a message needs at least one of these headers to have any attachments
+ATTACHMENT_CRITERIA = OR(
+    header=[
+        H("Content-Type", "multipart"),
+        H("Content-Type", "name"),
+        H("Content-Disposition", ""),
+        H("Content-ID", ""),
+    ]
+)
+
+UID_STATUS_OPTIONS = ("MESSAGES", "UIDNEXT", "UIDVALIDITY")
+
+MESSAGE_INFO_PARTS = "(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS (DATE)])"
+
+MESSAGE_STRUCTURE_PARTS = "(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (DATE)])"
+
+FETCH_BATCH_SIZE = 500
+
+# servers reject overlong command lines (e.g. "maximum request size exceeded"), so
+# keep UID sets well below common limits
+MAX_UID_SET_SIZE = 8 * 1024
+
+# whole messages are fetched in bulk, so keep batches small
+BULK_FETCH_SIZE = 50
+
+PREFETCH_SIZE = 4
+
+# fewer attachments than this are read from a folder on a single connection
+MIN_CAT_BATCH_SIZE = 20
+
+DEFAULT_CACHE_TTL = 30
+
+DEFAULT_CONNECTION_POOL_SIZE = 3
+
+CONNECTION_ERRORS = (IMAP4.abort, ConnectionResetError, BrokenPipeError)
+
+# message metadata is kept for this many messages at most, so a long-lived instance
+# does not hold on to every message it has come across
+MESSAGE_INFO_CACHE_SIZE = 10_000
+
+# message structures are only kept for messages that attachments were recently read
+# or listed from
+ATTACHMENT_CACHE_SIZE = 256
+
+# each watched folder holds a connection open, and servers limit connections per user
+MAX_IDLE_FOLDERS = 5
+
+# re-issue IDLE well within the 29 minutes servers are required to allow (RFC 2177)
+IDLE_TIMEOUT = 5 * 60
+
+IDLE_CHANGE_PATTERN = re.compile(
+    rb"\* (?:\d+ (?:EXISTS|EXPUNGE)|VANISHED)\b", re.IGNORECASE
+)
+
+
+# connections are shared between filesystem instances with the same credentials,
+# within the same process and thread
+_CONNECTIONS: dict[tuple[str, str, bytes, int, int], MailBox] = {}
+_CONNECTIONS_LOCK = threading.Lock()
+
+
+@atexit.register
+def _close_connections():
+    with _CONNECTIONS_LOCK:
+        for mailbox in _CONNECTIONS.values():
+            with contextlib.suppress(IMAP4.error, OSError):
+                mailbox.logout()
+
+        _CONNECTIONS.clear()
+
+
+def _get_fetch_kwargs(kwargs: dict[str, Any]):
+    # most calls pass no options, so only look at the ones given
+    return {k: kwargs[k] for k in kwargs.keys() & FETCH_OPTIONS}
+
+
+@functools.lru_cache(maxsize=4096)
+def _split_attachment_path(path: str) -> tuple[str, str, str]:
+    # folder names may contain the delimiter, but message IDs and filenames cannot
+    folder, msg_id, filename = ("", "", *path.strip("/").rsplit("/", 2))[-3:]
+    return folder, msg_id, filename
+
+
+def _chunk_uids(
+    uids: Iterable[str],
+    max_count: int = FETCH_BATCH_SIZE,
+    max_bytes: int = MAX_UID_SET_SIZE,
+) -> Iterator[str]:
+    uid_set = []
+    size = 0
+
+    for uid in uids:
+        # each UID after the first is preceded by a comma
+        if uid_set and (len(uid_set) >= max_count or size + 1 + len(uid) > max_bytes):
+            yield ",".join(uid_set)
+            uid_set = []
+            size = 0
+
+        size += len(uid) + 1 if uid_set else len(uid)
+        uid_set.append(uid)
+
+    if uid_set:
+        yield ",".join(uid_set)
+
+
+def _complete_command(client: IMAP4, name: str, tag: bytes):
+    try:
+        return client._command_complete(name, tag)  # noqa: SLF001
+    except IMAP4.abort:
+        raise
+    except IMAP4.error as e:
+        return e
+
+
+def _uid_items(result: tuple, uid: str) -> Iterator[dict[str, Any]]:
+    # responses left over from other commands may carry the same items for other
+    # messages, so only take those for the UID that was fetched
+    for item in parse_fetch_response(result[1]):
+        if item.get("UID") == uid.encode():
+            yield item
+
+
+def _is_connected(mailbox: MailBox):
+    client = mailbox.client
+    return client.state in ("AUTH", "SELECTED") and client.sock.fileno() != -1
+
+
+class _LRUCache(OrderedDict):
+    """Dictionary that drops its least recently used items beyond a maximum size."""
+
+    def __init__(self, max_size: int) -> None:
+        """Initialise cache.
+
+        Args:
+            max_size: maximum number of items
+        """
+        super().__init__()
+        self.max_size = max_size
+        self._lock = threading.RLock()
+
+    @override
+    def __getitem__(self, key) -> Any:
+        with self._lock:
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            return value
+
+    @override
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+
+            while len(self) > self.max_size:
+                del self[next(iter(self))]
+
+    @override
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def discard_where(self, predicate: Callable[[Any], bool]):
+        """Drop items with keys that match a predicate.
+
+        Args:
+            predicate: function that returns whether to drop an item, given its key
+        """
+        with self._lock:
+            for key in [k for k in self if predicate(k)]:
+                del self[key]
+
+
+def _retry_on_drop(func):
+    @functools.wraps(func)
+    def wrapper(self: IMAPFileSystem, *args, **kwargs):
+        # another instance may have logged out of the shared connection
+        if not _is_connected(self._main_mailbox):
+            self._reconnect()
+
+        try:
+            return func(self, *args, **kwargs)
+        except CONNECTION_ERRORS:
+            self._reconnect()
+
+        return func(self, *args, **kwargs)
+
+    return wrapper
 
-FETCH_OPTIONS = {
-    "charset",
-    "limit",
-    "mark_seen",
-    "reverse",
-    "headers_only",
-    "bulk",
-    "sort",
-    "since",
-}
+
+class _PrefetchIter:
+    """Iterator over items produced by a background thread."""
+
+    _DONE = object()
+
+    def __init__(self, produce: Callable[[], Iterator], maxsize=PREFETCH_SIZE) -> None:
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._closed = threading.Event()
+        # the thread must not reference the iterator, so it can be closed on deletion
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(produce, self._queue, self._closed),
+            daemon=True,
+        )
+        self._thread.start()
+
+    def __iter__(self) -> _PrefetchIter:
+        return self
+
+    def __next__(self) -> object:
+        if self._closed.is_set():
+            raise StopIteration
+
+        item = self._queue.get()
+
+        if item is self._DONE:
+            self._closed.set()
+            raise StopIteration
+
+        if isinstance(item, BaseException):
+            self._closed.set()
+            raise item
+
+        return item
+
+    def __del__(self) -> None:
+        self.close()
+
+    def close(self):
+        self._closed.set()
+
+        # unblock the producer so it can stop at the next item
+        while self._thread.is_alive():
+            with contextlib.suppress(queue.Empty):
+                self._queue.get(timeout=0.1)
+
+    @classmethod
+    def _run(
+        cls,
+        produce: Callable[[], Iterator],
+        items: queue.Queue,
+        closed: threading.Event,
+    ) -> None:
+        try:
+            for item in produce():
+                if closed.is_set():
+                    return
+
+                items.put(item)
+        except Exception as e:  # noqa: BLE001
+            items.put(e)
+        else:
+            items.put(cls._DONE)
+
+
+class IMAPConnectionPool:
+    """Pool of mailbox connections, for operations that run concurrently."""
+
+    def __init__(
+        self,
+        connect: Callable[[], MailBox],
+        max_size: int,
+        min_size: int = 0,
+    ) -> None:
+        """Initialise connection pool.
+
+        Args:
+            connect: function that returns a new logged-in mailbox
+            max_size: maximum number of connections
+            min_size: number of connections to log in immediately
+        """
+        self.max_size = max_size
+        self._connect = connect
+        self._idle: queue.Queue[MailBox | None] = queue.Queue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._closed = False
+
+        for _ in range(min(min_size, max_size)):
+            self._idle.put(connect())
+            self._size += 1
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[MailBox]:
+        """Acquire a connection, waiting for one if the pool is at its maximum size.
+
+        The connection is released back to the pool on exit, unless it was dropped.
+
+        Yields:
+            Logged-in mailbox.
+        """
+        try:
+            mailbox = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._size < self.max_size
+                self._size += create
+
+            mailbox = self._idle.get() if not create else None
+
+        if mailbox:
+            # the view of the folder left selected may have gone out of date while the
+            # connection was idle, so have it selected again on first use
+            mailbox.folder._current_folder = None  # noqa: SLF001
+
+        try:
+            mailbox = mailbox or self._connect()
+            yield mailbox
+        except CONNECTION_ERRORS:
+            # do not return a dropped connection to the pool
+            self.discard()
+            raise
+        except BaseException:
+            if mailbox:
+                self.release(mailbox)
+            else:
+                self.discard()
+
+            raise
+
+        self.release(mailbox)
+
+    def release(self, mailbox: MailBox):
+        """Return a connection to the pool.
+
+        Args:
+            mailbox: mailbox acquired from the pool
+        """
+        if self._closed:
+            self._logout(mailbox)
+
+            # leave the slot to any caller waiting for a connection
+            self._idle.put(None)
+            return
+
+        self._idle.put(mailbox)
+
+    def discard(self):
+        """Give up a connection acquired from the pool, so another can be created."""
+        with self._lock:
+            self._size -= 1
+
+    def close(self):
+        """Log out of idle connections, and of connections in use once released."""
+        self._closed = True
+
+        while True:
+            try:
+                mailbox = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            self.discard()
+
+            if mailbox:
+                self._logout(mailbox)
+
+    @staticmethod
+    def _logout(mailbox: MailBox) -> None:
+        with contextlib.suppress(IMAP4.error, OSError):
+            mailbox.logout()
+
+
+class IMAPAttachmentFile(AbstractBufferedFile):
+    """Attachment file, reading ranges of decoded content as they are needed."""
+
+    def __init__(
+        self,
+        fs: IMAPFileSystem,
+        path: str,
+        message: str,
+        attachment: AttachmentPart,
+        **kwargs,
+    ) -> None:
+        """Initialise attachment file.
+
+        Args:
+            fs: filesystem the attachment is read from
+            path: attachment path
+            message: path of the message, by UID (e.g. `INBOX/123`)
+            attachment: attachment part of the message
+            **kwargs: `fsspec.spec.AbstractBufferedFile` options
+        """
+        self.folder, _, self.uid = message.rpartition("/")
+        self.attachment = attachment
+        super().__init__(fs, path, size=attachment.size, **kwargs)
+
+    @override
+    def _fetch_range(self, start: int, end: int) -> bytes:
+        return self.fs._fetch_attachment_range(self, start, end)  # noqa: SLF001
 
 
 class IMAPFileSystem(AbstractFileSystem):
@@ -37,203 +465,1614 @@ class IMAPFileSystem(AbstractFileSystem):
     def __init__(self, *args, **storage_options) -> None:
         super().__init__(*args, **storage_options)
 
-        host = storage_options.pop("host")
-        username = storage_options.pop("username")
-        access_token = storage_options.pop("access_token", None)
-        password = storage_options.pop("password", None)
+        self._host = storage_options.pop("host")
+        self._username = storage_options.pop("username")
+        self._access_token = storage_options.pop("access_token", None)
+        self._password = storage_options.pop("password", None)
+        self.cache_ttl = storage_options.pop("cache_ttl", DEFAULT_CACHE_TTL)
+        self.connection_pool_size = storage_options.pop(
+            "connection_pool_size", DEFAULT_CONNECTION_POOL_SIZE
+        )
+        self.share_connection = storage_options.pop("share_connection", True)
+        self.idle = storage_options.pop("idle", False)
+        self.enumerate_subfolders = storage_options.pop("enumerate_subfolders", False)
 
-        if not any((access_token, password)):
+        if not any((self._access_token, self._password)):
             msg = "Either 'access_token' or 'password' should be specified"
             raise ValueError(msg)
 
-        self.mailbox = MailBox(host)
+        # log in on first use, as fsspec may create instances that are never used
+        self._mailbox: MailBox | None = None
+        self._mailbox_lock = threading.Lock()
+
+        self._folder_cache: dict[str, tuple[float, list[FolderInfo]]] = {}
+        self._uid_cache: dict[tuple[str, date | None], dict] = {}
+        self._uid_generations: dict[str, int] = {}
+        self._uid_lock = threading.Lock()
+        self._message_info_cache: _LRUCache[str, tuple[int, datetime]] = _LRUCache(
+            MESSAGE_INFO_CACHE_SIZE
+        )
+        self._bodystructure_cache: _LRUCache[str, list] = _LRUCache(
+            ATTACHMENT_CACHE_SIZE
+        )
+        self._attachment_parts_cache: _LRUCache[str, dict[str, tuple[str, Message]]] = (
+            _LRUCache(ATTACHMENT_CACHE_SIZE)
+        )
+        self._status_cache: dict[str, tuple[float, dict[str, int]]] = {}
+        self._select_status: weakref.WeakKeyDictionary[
+            MailBox, tuple[str, int, dict[str, int]]
+        ] = weakref.WeakKeyDictionary()
+
+        # the pool is closed along with the filesystem, so must not keep it alive
+        connect_ref = weakref.WeakMethod(self._connect)
+
+        def connect() -> MailBox:
+            return connect_ref()()
+
+        self._pool = IMAPConnectionPool(connect, self.connection_pool_size)
+
+        self._idle_threads: dict[str, threading.Thread] = {}
+        self._idle_mailboxes: dict[str, MailBox] = {}
+        self._idle_lock = threading.Lock()
+
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        self._prefetched: tuple[str, Future[bytes | None]] | None = None
+        self._prefetch_lock = threading.Lock()
+
+        # background connections and threads must not outlive the filesystem, so
+        # nothing passed here may refer back to it
+        self._closed = threading.Event()
+        self._finalizer = weakref.finalize(
+            self,
+            self._close,
+            self._closed,
+            self._pool,
+            self._idle_mailboxes,
+            self._prefetch_executor,
+            (
+                self._message_info_cache,
+                self._bodystructure_cache,
+                self._attachment_parts_cache,
+            ),
+        )
+
+    def close(self):
+        """Log out of pooled and IDLE connections, and stop background work.
+
+        Cached message details are dropped too. This also happens once the filesystem
+        is garbage collected, or on exit. The main mailbox connection is left open, as
+        it may be shared.
+        """
+        self._finalizer()
+
+    @staticmethod
+    def _close(
+        closed: threading.Event,
+        pool: IMAPConnectionPool,
+        idle_mailboxes: dict[str, MailBox],
+        prefetch_executor: ThreadPoolExecutor,
+        caches: tuple[_LRUCache, ...],
+    ) -> None:
+        closed.set()
+        prefetch_executor.shutdown(wait=False)
+
+        for cache in caches:
+            cache.clear()
+
+        # interrupt IDLE, so watcher threads log out and finish
+        for mailbox in list(idle_mailboxes.values()):
+            with contextlib.suppress(OSError):
+                mailbox.client.shutdown()
+
+        pool.close()
+
+    @property
+    def mailbox(self) -> MailBox:
+        """Mailbox connection, logged in on first access.
+
+        The filesystem only examines folders (read-only), so the folder it last used is
+        selected again read-write before the connection is handed out.
+        """
+        mailbox = self._main_mailbox
+        client = mailbox.client
+
+        if client.state == "SELECTED" and client.is_readonly:
+            with contextlib.suppress(MailboxFolderSelectError, IMAP4.error, OSError):
+                self._set_folder(mailbox.folder.get(), mailbox, readonly=False)
+
+        return mailbox
 
-        if access_token:
-            self.mailbox.xoauth2(username, access_token)
+    @mailbox.setter
+    def mailbox(self, mailbox: MailBox):
+        self._mailbox = mailbox
+
+    @property
+    def _main_mailbox(self) -> MailBox:
+        if self._mailbox is None:
+            with self._mailbox_lock:
+                if self._mailbox is None:
+                    self._mailbox = self._shared_mailbox()
+
+        return self._mailbox
+
+    def _connect(self):
+        mailbox = MailBox(self._host)
+
+        if self._access_token:
+            mailbox.xoauth2(self._username, self._access_token)
         else:
-            self.mailbox.login(username, password)
+            mailbox.login(self._username, self._password)
+
+        # servers usually only advertise extensions once authenticated, most of them
+        # as part of the login response
+        login_data = mailbox.login_result[1][0] or b""
+        match = re.search(rb"\[CAPABILITY ([^\]]*)\]", login_data)
+        capabilities = match[1] if match else mailbox.client.capability()[1][-1]
+        mailbox.client.capabilities = tuple(capabilities.decode().upper().split())
+
+        return mailbox
+
+    def _reconnect(self):
+        with contextlib.suppress(IMAP4.error, OSError):
+            self._main_mailbox.logout()
+
+        self.mailbox = self._shared_mailbox()
+
+    def _shared_mailbox(self):
+        if not self.share_connection:
+            return self._connect()
+
+        secret = (self._access_token or self._password).encode()
+        key = (
+            self._host,
+            self._username,
+            hashlib.sha256(secret).digest(),
+            os.getpid(),
+            threading.get_ident(),
+        )
+
+        with _CONNECTIONS_LOCK:
+            mailbox = _CONNECTIONS.get(key)
+
+            if not (mailbox and _is_connected(mailbox)):
+                mailbox = _CONNECTIONS[key] = self._connect()
+
+        return mailbox
 
     @override
+    @_retry_on_drop
     def ls(self, path: str, detail=True, **kwargs):
-        fetch_kwargs = {k: v for k, v in kwargs.items() if k in FETCH_OPTIONS}
+        fetch_kwargs = _get_fetch_kwargs(kwargs)
 
         try:
-            details = self._ls(path, **fetch_kwargs)
+            details = self._ls(path, detail=detail, **fetch_kwargs)
+        except IMAP4.abort:
+            raise
         except (MailboxFolderSelectError, IMAP4.error) as e:
+            self.invalidate_cache(path)
             raise FileNotFoundError(path) from e
 
         return list(details.values() if detail else details.keys())
 
-    def _ls(self, path: str, **fetch_kwargs):
-        path = path.strip("/")
+    @override
+    def glob(self, path, maxdepth=None, **kwargs):
+        pattern = self._strip_protocol(path)
+        *folder_parts, msg_id, _ = pattern.split("/") if "/" in pattern else ("", "")
 
-        folders = self.mailbox.folder.list(path)
+        # matching attachments of any message in a folder can be listed in one go,
+        # rather than listing each message in turn, unless the message wildcard could
+        # also match subfolders (only `*` is understood by `ls` in place of a UID)
+        if (
+            path.endswith("/")
+            or "**" in pattern
+            or not folder_parts
+            or msg_id != "*"
+            or any(has_magic(part) for part in folder_parts)
+            or self._has_subfolders("/".join(folder_parts))
+        ):
+            return super().glob(path, maxdepth=maxdepth, **kwargs)
 
-        details = {
-            f.name: {"name": f.name, "size": 0, "type": "directory"} for f in folders
+        detail = kwargs.pop("detail", False)
+        match = re.compile(glob_translate(pattern)).match
+
+        try:
+            entries = self.ls(pattern, detail=True, **kwargs)
+        except FileNotFoundError:
+            entries = []
+
+        out = {
+            entry["name"]: entry
+            for entry in sorted(entries, key=lambda entry: entry["name"])
+            if match(entry["name"])
         }
 
+        return out if detail else list(out)
+
+    def _has_subfolders(self, folder: str):
+        try:
+            folders = self._cached_folders(folder)
+        except (MailboxFolderSelectError, IMAP4.error):
+            return True
+
+        return any(f.name.startswith(f"{folder}/") for f in folders)
+
+    @override
+    def invalidate_cache(self, path=None):
+        if path is None:
+            self._folder_cache.clear()
+            self._uid_cache.clear()
+            self._message_info_cache.clear()
+            self._bodystructure_cache.clear()
+            self._attachment_parts_cache.clear()
+            self._status_cache.clear()
+        else:
+            path = path.strip("/")
+
+            # listings of parent folders include the path, so drop those too
+            self._folder_cache = {
+                k: v
+                for k, v in self._folder_cache.items()
+                if not (self._is_subpath(k, path) or self._is_subpath(path, k))
+            }
+            self._uid_cache = {
+                k: v
+                for k, v in self._uid_cache.items()
+                if not self._is_subpath(k[0], path)
+            }
+
+            # message caches are also cleared on close, so are kept the same objects
+            for cache in (
+                self._message_info_cache,
+                self._bodystructure_cache,
+                self._attachment_parts_cache,
+            ):
+                cache.discard_where(lambda k: self._is_subpath(k, path))
+
+            self._status_cache = {
+                k: v
+                for k, v in self._status_cache.items()
+                if not self._is_subpath(k, path)
+            }
+
+        super().invalidate_cache(path)
+
+    def _ls(self, path: str, *, detail=True, **fetch_kwargs):
+        path = path.strip("/")
+
+        # message and attachment paths cannot have subfolders, so skip listing them
+        folders = [] if self._is_message_path(path) else self._cached_folders(path)
+
+        # only names are returned without detail, so skip building entries
+        if detail:
+            details = {
+                f.name: {"name": f.name, "size": 0, "type": "directory"}
+                for f in folders
+            }
+        else:
+            details = dict.fromkeys(f.name for f in folders)
+
         if not path:
             return details
 
+        subfolders = [
+            f.name for f in folders if f.name != path and "\\Noselect" not in f.flags
+        ]
+
+        # warming the cache for subfolders is speculative, and holds up the listing
+        if subfolders and self.enumerate_subfolders and self.connection_pool_size:
+            self._enumerate_folders(subfolders, since=fetch_kwargs.get("since"))
+
         try:
-            self.mailbox.folder.set(path)
+            self._select(path)
         except MailboxFolderSelectError:
             if "/" not in path:
                 raise
 
-            self.mailbox.folder.set(self.mailbox.folder.get())
+            self._select(self._main_mailbox.folder.get())
 
-        folder_path = Path(self.mailbox.folder.get())
+        folder = self._main_mailbox.folder.get()
 
-        if not (folder_path.is_relative_to(path) or (folder_path / "*").match(path)):
-            try:
-                msgs = self._get_messages(path, **fetch_kwargs)
-                filename = None
-            except MailboxFolderSelectError:
-                parent, filename = self._split_path_last(path)
+        if not (
+            self._is_subpath(folder, path) or self._path_matcher(path)(f"{folder}/*")
+        ):
+            self._ls_attachments(path, details, detail=detail, **fetch_kwargs)
+        else:
+            self._ls_messages(path, details, detail=detail, **fetch_kwargs)
 
-                if "/" not in parent:
-                    raise
+        return details
 
-                msgs = self._get_messages(parent, **fetch_kwargs)
+    def _ls_attachments(
+        self, path: str, details: dict, *, detail: bool, **fetch_kwargs
+    ):
+        # attachment sizes are only known without fetching whole messages if the
+        # server can report decoded part sizes (RFC 3516)
+        get_messages = (
+            self._get_message_structures
+            if self._binary_supported
+            else self._get_messages
+        )
 
-            msg_attachments = ((msg, att) for msg in msgs for att in msg.attachments)
+        # attachments are only fetched with whole messages, and several messages can
+        # be fetched per round-trip
+        fetch_kwargs["headers_only"] = False
+        fetch_kwargs.setdefault("bulk", BULK_FETCH_SIZE)
 
-            for msg, att in msg_attachments:
-                att_filename = re.sub(r"[\r\n]", "", att.filename)
+        try:
+            msgs = get_messages(path, **fetch_kwargs)
+            filename = None
+        except MailboxFolderSelectError:
+            parent, filename = self._split_path_last(path)
 
-                if filename and not fnmatch.fnmatch(att_filename, filename):
-                    continue
+            if "/" not in parent:
+                raise
 
-                resolved_path = Path(self.mailbox.folder.get(), msg.uid, att_filename)
+            msgs = get_messages(
+                parent,
+                attachments_only=True,
+                **fetch_kwargs,
+            )
 
-                if resolved_path.is_relative_to(path) or resolved_path.match(path):
-                    name = str(resolved_path)
-                    details[name] = {
-                        "name": name,
-                        "size": att.size,
-                        "type": "file",
-                        "last_modified": msg.date,
-                    }
+        # compile the filename pattern once, rather than for every attachment
+        match_filename = (
+            re.compile(fnmatch.translate(filename)).match if filename else None
+        )
+        match_path = self._path_matcher(path)
+        folder = self._main_mailbox.folder.get()
+        msg_attachments = ((msg, att) for msg in msgs for att in msg.attachments)
 
-            if filename and not details:
-                raise FileNotFoundError(path)
+        for msg, att in msg_attachments:
+            att_filename = re.sub(r"[\r\n]", "", att.filename)
 
-        else:
-            uids = self.mailbox.uids(
-                AND(date_gte=fetch_kwargs.pop("since", None), all=True)
+            if match_filename and not match_filename(att_filename):
+                continue
+
+            name = f"{folder}/{msg.uid}/{att_filename}"
+
+            if not (self._is_subpath(name, path) or match_path(name)):
+                continue
+
+            details[name] = (
+                {
+                    "name": name,
+                    "size": att.size,
+                    "type": "file",
+                    "last_modified": msg.date,
+                }
+                if detail
+                else None
             )
 
-            if fetch_kwargs.pop("reverse", False):
-                uids = reversed(uids)
+        if filename and not details:
+            raise FileNotFoundError(path)
 
-            limit = fetch_kwargs.pop("limit", None)
+    def _ls_messages(self, path: str, details: dict, *, detail: bool, **fetch_kwargs):
+        folder = self._main_mailbox.folder.get()
+        since = fetch_kwargs.pop("since", None)
+        reverse = fetch_kwargs.pop("reverse", False)
+        limit = fetch_kwargs.pop("limit", None)
 
-            for i, msg_id in enumerate(uids, start=1):
-                if limit and i > limit:
-                    break
+        # without cached UIDs, only search for as many messages as are listed
+        if limit and not since and (folder, None) not in self._uid_cache:
+            uids = self._uid_page(folder, limit, reverse=reverse)
+        else:
+            uids = self._cached_uids(folder, since=since)
+            uids = reversed(uids) if reverse else uids
+        match_path = self._path_matcher(path)
+        msg_ids = {}
 
-                resolved_path = Path(self.mailbox.folder.get(), msg_id)
+        for i, msg_id in enumerate(uids, start=1):
+            if limit and i > limit:
+                break
 
-                if resolved_path.is_relative_to(path) or resolved_path.match(path):
-                    name = str(resolved_path)
-                    details[name] = {"name": name, "size": 0, "type": "directory"}
+            name = f"{folder}/{msg_id}"
 
-        return details
+            if self._is_subpath(name, path) or match_path(name):
+                msg_ids[name] = msg_id
+
+        if not detail:
+            details.update(dict.fromkeys(msg_ids))
+            return
+
+        infos = self._cached_message_info(folder, list(msg_ids.values()))
+
+        for name, msg_id in msg_ids.items():
+            # message may have been expunged since the search
+            if info := infos.get(msg_id):
+                details[name] = {
+                    "name": name,
+                    "size": info[0],
+                    "type": "directory",
+                    "last_modified": info[1],
+                }
+
+    @override
+    @_retry_on_drop
+    def _open(self, path, mode="rb", block_size=None, cache_options=None, **kwargs):
+        fetch_kwargs = _get_fetch_kwargs(kwargs)
+        folder, uid, section, part = self._find_attachment_part(path, **fetch_kwargs)
+
+        if not self._binary_supported:
+            # without BINARY, parts can only be fetched encoded, so decode them whole
+            # and have the file read from that
+            payload = self._read_attachment(path, **fetch_kwargs)
+            size = len(payload)
+            cache_type, cache_options = "all", {"data": payload}
+        else:
+            result = self._main_mailbox.client.uid(
+                "FETCH", uid, f"(BINARY.SIZE[{section}])"
+            )
+            check_command_status(result, MailboxFetchError)
+            size = next(
+                (
+                    int(item[f"BINARY.SIZE[{section}]"])
+                    for item in _uid_items(result, uid)
+                    if f"BINARY.SIZE[{section}]" in item
+                ),
+                None,
+            )
+            cache_type = kwargs.get("cache_type", "readahead")
+
+        if size is None:
+            raise FileNotFoundError(path)
+
+        return IMAPAttachmentFile(
+            self,
+            path,
+            f"{folder}/{uid}",
+            AttachmentPart(
+                section,
+                MailAttachment(part).filename,
+                size,
+                part.get("Content-Transfer-Encoding", "7bit").lower(),
+            ),
+            mode=mode,
+            block_size=block_size,
+            cache_type=cache_type,
+            cache_options=cache_options,
+        )
+
+    @override
+    @_retry_on_drop
+    def cat_file(self, path, start=None, end=None, **kwargs):
+        fetch_kwargs = _get_fetch_kwargs(kwargs)
+
+        # reading whole attachments needs no size up front, so skip opening a file
+        return self._read_attachment(path, **fetch_kwargs)[start:end]
 
     @override
-    def _open(self, path, **kwargs):
-        fetch_kwargs = {k: v for k, v in kwargs.items() if k in FETCH_OPTIONS}
+    def cat(self, path, recursive=False, on_error="raise", **kwargs):
+        paths = self.expand_path(path, recursive=recursive)
+
+        if (
+            len(paths) > 1
+            or isinstance(path, list)
+            or paths[0] != self._strip_protocol(path)
+        ):
+            return self._cat_many(paths, on_error=on_error, **kwargs)
 
-        att = self._get_attachment(path, **fetch_kwargs)
-        return io.BytesIO(att.payload)
+        return self.cat_file(paths[0], **kwargs)
 
     @override
+    @_retry_on_drop
     def created(self, path, **kwargs):
-        fetch_kwargs = {k: v for k, v in kwargs.items() if k in FETCH_OPTIONS}
+        fetch_kwargs = _get_fetch_kwargs(kwargs)
+
+        path = path.strip("/")
+        parent, filename = self._split_path_last(path)
+
+        # attachments have the date of their message, so a message or attachment
+        # seen before (e.g. by created() before modified()) needs no round-trip
+        if info := self._message_info_cache.get(path):
+            return info[1]
 
+        if filename in self._attachment_parts_cache.get(parent, {}) and (
+            info := self._message_info_cache.get(parent)
+        ):
+            return info[1]
+
+        # only the date header is needed, and attachments are found from the
+        # BODYSTRUCTURE, so the message itself is never downloaded
         try:
-            msg = next(
-                self._get_messages(
-                    path,
-                    headers_only=fetch_kwargs.pop("headers_only", False),
-                    **fetch_kwargs,
-                )
-            )
+            uid = self._resolve_uid(path, **fetch_kwargs)
+            folder = self._split_path_last(path)[0]
         except MailboxFolderSelectError:
-            parent, filename = self._split_path_last(path)
-            msg = next(
-                self._get_messages(
-                    parent,
-                    headers_only=False,  # headers only does not fetch attachments
-                    **fetch_kwargs,
-                )
-            )
-            self._get_attachment_from_message(msg, filename)
+            folder, msg_id, filename = _split_attachment_path(path)
 
-        return msg.date
+            if not folder:
+                raise FileNotFoundError(path) from None
+
+            uid = self._resolve_uid(f"{folder}/{msg_id}", **fetch_kwargs)
+
+            if filename not in self._attachment_parts(folder, uid):
+                raise FileNotFoundError(path) from None
+
+        if not (info := self._cached_message_info(folder, [uid]).get(uid)):
+            raise FileNotFoundError(path)
+
+        return info[1]
 
     @override
     def modified(self, path, **kwargs):
         return self.created(path, **kwargs)
 
-    def _get_messages(self, path: str, **fetch_kwargs):
+    def _get_messages(self, path: str, *, attachments_only=False, **fetch_kwargs):
         path = path.strip("/")
+        fetch_kwargs.setdefault("mark_seen", False)
+        criteria = self._get_criteria(
+            path,
+            since=fetch_kwargs.pop("since", None),
+            attachments_only=attachments_only,
+            readonly=not fetch_kwargs["mark_seen"],
+        )
+        all_ = path.endswith("/*")
+
+        # the UID set never needs to reach the client unless it is limited or sorted
+        # there, and everything is fetched in one go, so keep to single messages
+        # unless bulk fetching was asked for
+        pipeline = (
+            self._searchres_supported
+            and not (fetch_kwargs.get("limit") or fetch_kwargs.get("sort"))
+            and (not all_ or fetch_kwargs.get("bulk") is True)
+        )
+
+        try:
+            if pipeline:
+                msgs = self._fetch_pipelined(criteria, **fetch_kwargs)
+            elif all_ and self.connection_pool_size:
+                # parse messages while the next ones are fetched in the background
+                msgs = _PrefetchIter(
+                    functools.partial(
+                        self._fetch_pooled,
+                        self._main_mailbox.folder.get(),
+                        criteria,
+                        **fetch_kwargs,
+                    )
+                )
+            else:
+                msgs = self._main_mailbox.fetch(criteria, **fetch_kwargs)
+
+            msg = next(msgs, None)
+        except IMAP4.abort:
+            raise
+        except IMAP4.error as e:
+            raise FileNotFoundError(path) from e
+
+        if msg:
+            # do not immediately exhaust messages iterator
+            return itertools.chain([msg], msgs)
+
+        raise FileNotFoundError(path)
+
+    def _fetch_pooled(self, folder: str, criteria: AND, **fetch_kwargs):
+        with self._pool.acquire() as mailbox:
+            self._select(folder, mailbox, readonly=not fetch_kwargs["mark_seen"])
+            yield from mailbox.fetch(criteria, **fetch_kwargs)
+
+    def _get_message_structures(
+        self,
+        path: str,
+        *,
+        attachments_only=False,
+        **fetch_kwargs,
+    ):
+        path = path.strip("/")
+        criteria = self._get_criteria(
+            path,
+            since=fetch_kwargs.get("since"),
+            attachments_only=attachments_only,
+        )
+
+        limit = fetch_kwargs.get("limit")
+
+        if isinstance(limit, int):
+            limit = slice(0, limit)
+
+        # every message is wanted, so skip the search and fetch all of them at once
+        fetch_all = path.endswith("/*") and not any(
+            fetch_kwargs.get(k) for k in ("since", "limit", "sort", "reverse")
+        )
+
+        try:
+            if fetch_all:
+                uids = ("1:*",)
+            else:
+                uids = self._main_mailbox.uids(
+                    criteria,
+                    fetch_kwargs.get("charset", "US-ASCII"),
+                    fetch_kwargs.get("sort"),
+                )
+                uids = tuple(reversed(uids) if fetch_kwargs.get("reverse") else uids)
+                uids = uids[limit or slice(None)]
+
+            msgs = self._fetch_message_structures(uids)
+            msg = next(msgs, None)
+        except IMAP4.abort:
+            raise
+        except (IMAP4.error, MailboxFetchError) as e:
+            # some servers reject a UID range for an empty folder
+            raise FileNotFoundError(path) from e
+
+        if msg:
+            # do not immediately exhaust messages iterator
+            return itertools.chain([msg], msgs)
+
+        raise FileNotFoundError(path)
+
+    def _get_criteria(
+        self,
+        path: str,
+        *,
+        since: date | None,
+        attachments_only: bool,
+        mailbox: MailBox | None = None,
+        readonly=True,
+    ):
+        mailbox = mailbox or self._main_mailbox
 
         if "/" not in path:
             raise FileNotFoundError(path)
 
         parent, msg_id = self._split_path_last(path)
-        self.mailbox.folder.set(parent)
+        self._select(parent, mailbox, readonly=readonly)
 
         all_ = msg_id == "*"
 
         try:
             criteria = AND(
-                date_gte=fetch_kwargs.pop("since", None),
+                date_gte=since,
                 all=True if all_ else None,
                 uid=msg_id if not all_ else None,
             )
         except TypeError as e:
             raise FileNotFoundError(path) from e
 
+        if attachments_only:
+            criteria = AND(criteria, ATTACHMENT_CRITERIA)
+
+        return criteria
+
+    def _fetch_message_structures(self, uids: tuple[str, ...]):
+        client = self._main_mailbox.client
+
+        for uid_set in _chunk_uids(uids):
+            result = client.uid("FETCH", uid_set, MESSAGE_STRUCTURE_PARTS)
+            check_command_status(result, MailboxFetchError)
+
+            items = [
+                item
+                for item in parse_fetch_response(result[1])
+                if "BODYSTRUCTURE" in item
+            ]
+            folder = self._main_mailbox.folder.get()
+
+            for item in items:
+                key = f"{folder}/{item['UID'].decode()}"
+                self._bodystructure_cache[key] = item["BODYSTRUCTURE"]
+            sizes = self._fetch_attachment_sizes(items)
+
+            for item in items:
+                yield get_message_structure(item, sizes.get(item["UID"], {}))
+
+    def _fetch_attachment_sizes(self, items: list[dict]):
+        client = self._main_mailbox.client
+        uids_by_sections: dict[tuple[str, ...], list[bytes]] = {}
+
+        for item in items:
+            sections = tuple(s for s, _ in iter_attachment_parts(item["BODYSTRUCTURE"]))
+
+            if sections:
+                uids_by_sections.setdefault(sections, []).append(item["UID"])
+
+        # messages usually share a structure, so fetch sizes for each distinct set of
+        # sections
+        items_by_uid = self._fetch_pipelined_uids(
+            client,
+            [
+                (uid_set, f"({' '.join(f'BINARY.SIZE[{s}]' for s in sections)})")
+                for sections, uids in uids_by_sections.items()
+                for uid_set in _chunk_uids(uid.decode() for uid in uids)
+            ],
+        )
+
+        return {
+            uid.encode(): {
+                k[len("BINARY.SIZE[") : -1]: int(v)
+                for k, v in item.items()
+                if k.startswith("BINARY.SIZE[")
+            }
+            for uid, item in items_by_uid.items()
+        }
+
+    @staticmethod
+    def _fetch_pipelined_uids(
+        client: IMAP4,
+        fetches: list[tuple[str, str]],
+    ) -> dict[str, dict]:
+        # send every command before reading any response, so the server can work
+        # through them without waiting on the client in between
+        tags = [
+            client._command("UID", "FETCH", uids, message_parts)  # noqa: SLF001
+            for uids, message_parts in fetches
+        ]
+
+        # read every response before checking any, so none are left behind (imaplib
+        # raises on BAD rather than returning it)
+        results = [_complete_command(client, "UID", tag) for tag in tags]
+
+        # take the FETCH data of every command, even if one of them failed, so none is
+        # left for a later command to pick up
+        _, data = client._untagged_response("OK", None, "FETCH")  # noqa: SLF001
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+            check_command_status(result, MailboxFetchError)
+
+        # responses to different commands may be interleaved, so merge by UID
+        items_by_uid: dict[str, dict] = {}
+
+        for item in parse_fetch_response(data):
+            if "UID" in item:
+                items_by_uid.setdefault(item["UID"].decode(), {}).update(item)
+
+        return items_by_uid
+
+    @property
+    def _searchres_supported(self):
+        return "SEARCHRES" in self._main_mailbox.client.capabilities
+
+    @property
+    def _binary_supported(self):
+        return "BINARY" in self._main_mailbox.client.capabilities
+
+    def _fetch_pipelined(
+        self,
+        criteria: AND,
+        charset="US-ASCII",
+        *,
+        mark_seen=False,
+        reverse=False,
+        headers_only=False,
+        **_,
+    ):
+        client = self._main_mailbox.client
+        message_parts = (
+            f"(BODY{'' if mark_seen else '.PEEK'}[{'HEADER' if headers_only else ''}]"
+            " UID FLAGS RFC822.SIZE)"
+        )
+        charset_args = ("CHARSET", charset) if charset else ()
+
+        # send both commands before reading either response, and have the server
+        # fetch from the saved search result ($) rather than sending it back (RFC 5182)
+        search_tag = client._command(  # noqa: SLF001
+            "UID",
+            "SEARCH",
+            "RETURN",
+            "(SAVE)",
+            *charset_args,
+            str(criteria).encode(charset or "US-ASCII"),
+        )
+        fetch_tag = client._command("UID", "FETCH", "$", message_parts)  # noqa: SLF001
+
+        search_result = client._command_complete("UID", search_tag)  # noqa: SLF001
+        fetch_result = client._command_complete("UID", fetch_tag)  # noqa: SLF001
+        check_command_status(search_result, MailboxUidsError)
+        check_command_status(fetch_result, MailboxFetchError)
+
+        _, fetch_data = client._untagged_response(*fetch_result, "FETCH")  # noqa: SLF001
+
+        if not fetch_data or fetch_data[0] is None:
+            return iter(())
+
+        fetch_items = chunked((reversed if reverse else iter)(fetch_data), 2)
+        return (MailMessage(fetch_item) for fetch_item in fetch_items)
+
+    def _select(
+        self,
+        folder: str,
+        mailbox: MailBox | None = None,
+        *,
+        readonly=True,
+    ):
+        mailbox = mailbox or self._main_mailbox
+        client = mailbox.client
+
+        # a failed SELECT leaves no folder selected, and imap_tools does not forget it
+        # (connections taken from the pool have forgotten it, see
+        # `IMAPConnectionPool.acquire`)
+        if (
+            client.state == "SELECTED"
+            and mailbox.folder.get() == folder
+            and (readonly or not client.is_readonly)
+        ):
+            return
+
+        # open folders read-only (EXAMINE) unless messages are to be marked as seen,
+        # so the server never has to write flags (e.g. \Recent) for a listing
+        self._set_folder(folder, mailbox, readonly=readonly)
+
+    def _set_folder(self, folder: str, mailbox: MailBox, *, readonly: bool):
+        client = mailbox.client
+        result = mailbox.folder.set(folder, readonly=readonly)
+
+        # the server reports the status of the folder as it is selected, though it may
+        # leave out some of it (`None`)
+        responses = {**client.untagged_responses, "EXISTS": result[1]}
+        self._select_status[mailbox] = (
+            folder,
+            client.tagnum,
+            {
+                k: int(value) if (value := responses.get(name, [None])[-1]) else None
+                for k, name in (
+                    ("MESSAGES", "EXISTS"),
+                    ("UIDNEXT", "UIDNEXT"),
+                    ("UIDVALIDITY", "UIDVALIDITY"),
+                )
+            },
+        )
+
+    def _cached_folders(self, path: str):
+        now = time.monotonic()
+        cached = self._folder_cache.get(path)
+
+        if cached and now < cached[0]:
+            return cached[1]
+
+        folders = self._list_folders(path)
+        self._folder_cache[path] = (now + self.cache_ttl, folders)
+
+        return folders
+
+    def _is_message_path(self, path: str):
+        # listings include every folder below the listed path, so any folder below a
+        # listed folder is known
+        now = time.monotonic()
+        folders = {
+            f.name
+            for expires, listed in self._folder_cache.values()
+            if now < expires
+            for f in listed
+        }
+
+        if path in folders:
+            return False
+
+        parent, msg_id = self._split_path_last(path)
+
+        if msg_id.isdigit() and parent in folders:
+            return True
+
+        folder, msg_id = self._split_path_last(parent)
+        return msg_id.isdigit() and folder in folders and parent not in folders
+
+    def _list_folders(self, path: str):
+        client = self._main_mailbox.client
+
+        if "LIST-STATUS" not in client.capabilities:
+            return self._main_mailbox.folder.list(path)
+
+        # have the server return the status of each folder with the listing, rather
+        # than asking for them one at a time (RFC 5819)
         try:
-            msgs = self.mailbox.fetch(
-                criteria,
-                mark_seen=fetch_kwargs.pop("mark_seen", False),
-                **fetch_kwargs,
+            result = client._simple_command(  # noqa: SLF001
+                "LIST",
+                encode_folder(path),
+                encode_folder("*"),
+                f"RETURN (STATUS ({' '.join(UID_STATUS_OPTIONS)}))",
             )
-            msg = next(msgs, None)
-        except IMAP4.error as e:
-            raise FileNotFoundError(path) from e
+        except IMAP4.abort:
+            raise
+        except IMAP4.error:
+            # imaplib raises on BAD, rather than returning it
+            result = ("BAD", [])
 
-        if msg:
-            # do not immediately exhaust messages iterator
-            return itertools.chain([msg], msgs)
+        if result[0] != "OK":
+            return self._main_mailbox.folder.list(path)
+
+        _, list_data = client._untagged_response(*result, "LIST")  # noqa: SLF001
+        _, status_data = client._untagged_response(*result, "STATUS")  # noqa: SLF001
+        expiry = time.monotonic() + self.cache_ttl
+
+        for folder, status in parse_status_response(status_data).items():
+            self._status_cache[folder] = (expiry, status)
+
+        return parse_list_response(list_data)
+
+    def _enumerate_folders(self, folders: list[str], since: date | None = None):
+        # warm the UID cache for folders that are likely to be listed next
+        with ThreadPoolExecutor(max_workers=self.connection_pool_size) as executor:
+            for folder in folders:
+                executor.submit(self._enumerate_folder, folder, since=since)
+
+    def _enumerate_folder(self, folder: str, since: date | None = None):
+        suppress = contextlib.suppress(MailboxFolderSelectError, IMAP4.error, OSError)
+
+        with suppress, self._pool.acquire() as mailbox:
+            self._select(folder, mailbox)
+            self._cached_uids(folder, since=since, mailbox=mailbox)
+
+    def _cached_uids(
+        self,
+        folder: str,
+        since: date | None = None,
+        mailbox: MailBox | None = None,
+    ):
+        mailbox = mailbox or self._main_mailbox
+        key = (folder, since)
+        now = time.monotonic()
+        generation = self._uid_generations.get(folder, 0)
+        cached = self._uid_cache.get(key)
+
+        # watched folders are invalidated as soon as they change
+        if cached and (now < cached["expiry"] or self._is_watched(folder)):
+            return cached["uids"]
+
+        status = self._folder_status(folder, mailbox)
+        uids = None
+
+        # without the full status, changes to the folder cannot be told apart, so
+        # search all of it again
+        if any(status.get(k) is None for k in UID_STATUS_OPTIONS):
+            cached = None
+
+        if cached and cached["uidvalidity"] != status["UIDVALIDITY"]:
+            # UIDs now refer to different messages
+            self.invalidate_cache(folder)
+        elif cached:
+            uids = cached["uids"]
+            uidnext = cached["uidnext"]
+
+            if uidnext != status["UIDNEXT"]:
+                # only search for messages added since the last listing
+                new_uids = mailbox.uids(AND(date_gte=since, uid=f"{uidnext}:*"))
+                uids = uids + [uid for uid in new_uids if int(uid) >= uidnext]
+
+            if (
+                cached["messages"] + len(uids) - len(cached["uids"])
+                != status["MESSAGES"]
+            ):
+                # messages have been expunged, so the cached UIDs are stale
+                uids = None
+
+        if uids is None:
+            uids = mailbox.uids(AND(date_gte=since, all=True))
+
+        entry = {
+            "expiry": now + self.cache_ttl,
+            "uidvalidity": status.get("UIDVALIDITY"),
+            "uidnext": status.get("UIDNEXT"),
+            "messages": status.get("MESSAGES"),
+            "uids": uids,
+        }
+
+        # the folder may have changed while it was searched, in which case the UIDs
+        # are already out of date
+        with self._uid_lock:
+            if self._uid_generations.get(folder, 0) == generation:
+                self._uid_cache[key] = entry
+
+        if self.idle:
+            self._watch_folder(folder)
+
+        return uids
+
+    def _uid_page(self, folder: str, limit: int, *, reverse: bool):
+        messages = self._folder_status(folder, self._main_mailbox).get("MESSAGES")
+
+        if messages is None:
+            uids = self._cached_uids(folder)
+            return (uids[::-1] if reverse else uids)[:limit]
+
+        if not messages:
+            return []
+
+        # message sequence numbers are in UID order, so the first or last messages
+        # are found without returning the UIDs of the whole folder
+        if reverse:
+            sequence_set = f"{max(messages - limit + 1, 1)}:{messages}"
+        else:
+            sequence_set = f"1:{min(limit, messages)}"
+
+        result = self._main_mailbox.client.fetch(sequence_set, "(UID)")
+        check_command_status(result, MailboxFetchError)
+        uids = sorted(
+            (item["UID"].decode() for item in parse_fetch_response(result[1])),
+            key=int,
+        )
+
+        return uids[::-1] if reverse else uids
+
+    def _is_watched(self, folder: str):
+        thread = self._idle_threads.get(folder)
+        return bool(thread and thread.is_alive())
+
+    def _watch_folder(self, folder: str):
+        if (
+            self._closed.is_set()
+            or "IDLE" not in self._main_mailbox.client.capabilities
+        ):
+            return
+
+        with self._idle_lock:
+            watched = [f for f in self._idle_threads if self._is_watched(f)]
+
+            if folder in watched or len(watched) >= MAX_IDLE_FOLDERS:
+                return
+
+            thread = threading.Thread(
+                target=self._idle_folder,
+                args=(weakref.ref(self), folder, self._closed, self._idle_mailboxes),
+            )
+            thread.daemon = True
+            thread.start()
+
+            self._idle_threads[folder] = thread
+
+    @staticmethod
+    def _idle_folder(
+        fs_ref: weakref.ref[IMAPFileSystem],
+        folder: str,
+        closed: threading.Event,
+        idle_mailboxes: dict[str, MailBox],
+    ) -> None:
+        # only hold the filesystem briefly, so that the thread does not keep it alive
+        def drop_uids():
+            fs = fs_ref()
+
+            if fs is not None:
+                fs._drop_uids(folder)  # noqa: SLF001
+
+        fs = fs_ref()
+
+        if fs is None:
+            return
+
+        suppress = contextlib.suppress(
+            MailboxFolderSelectError,
+            MailboxTaggedResponseError,
+            IMAP4.error,
+            OSError,
+        )
+
+        try:
+            with suppress, fs._connect() as mailbox:  # noqa: SLF001
+                del fs
+                idle_mailboxes[folder] = mailbox
+
+                if closed.is_set():
+                    return
+
+                client = mailbox.client
+                mailbox.folder.set(folder, readonly=True)
+                client.untagged_responses.clear()
+                mailbox.idle.start()
+
+                # changes made before the folder was being watched may have been missed
+                drop_uids()
+
+                while not closed.is_set():
+                    responses = mailbox.idle.poll(timeout=IDLE_TIMEOUT)
+                    responses += mailbox.idle.stop()[1]
+
+                    # changes may also be reported outside of IDLE
+                    changed = any(
+                        IDLE_CHANGE_PATTERN.match(r) for r in responses if r
+                    ) or any(
+                        k in client.untagged_responses for k in ("EXISTS", "EXPUNGE")
+                    )
+                    client.untagged_responses.clear()
+
+                    if changed:
+                        drop_uids()
+
+                    mailbox.idle.start()
+        finally:
+            idle_mailboxes.pop(folder, None)
+
+            # changes are no longer noticed, so do not keep relying on cached UIDs
+            drop_uids()
+
+    def _drop_uids(self, folder: str):
+        with self._uid_lock:
+            self._uid_generations[folder] = self._uid_generations.get(folder, 0) + 1
+
+            for key in [k for k in list(self._uid_cache) if k[0] == folder]:
+                self._uid_cache.pop(key, None)
+
+    def _folder_status(self, folder: str, mailbox: MailBox):
+        # use the status returned with the folder listing, if it is recent enough
+        cached = self._status_cache.pop(folder, None)
+
+        if cached and time.monotonic() < cached[0]:
+            return cached[1]
+
+        # STATUS is not to be used for the selected folder (RFC 3501 6.3.10), so
+        # select it again for its status, unless no command has been sent since it was
+        client = mailbox.client
+        selected = self._select_status.get(mailbox)
+
+        if not (selected and selected[:2] == (folder, client.tagnum)):
+            self._set_folder(folder, mailbox, readonly=client.is_readonly)
+            selected = self._select_status[mailbox]
+
+        return selected[2]
+
+    def _cached_message_info(self, folder: str, uids: list[str]):
+        infos = {
+            uid: info
+            for uid in uids
+            if (info := self._message_info_cache.get(f"{folder}/{uid}"))
+        }
+        missing = [uid for uid in uids if uid not in infos]
+
+        # fetch size and date for many messages per round-trip
+        for uid_set in _chunk_uids(missing):
+            fetch_result = self._main_mailbox.client.uid(
+                "FETCH", uid_set, MESSAGE_INFO_PARTS
+            )
+            check_command_status(fetch_result, MailboxFetchError)
+
+            if not fetch_result[1] or fetch_result[1][0] is None:
+                continue
+
+            for fetch_item in chunked(fetch_result[1], 2):
+                msg = MailMessage(fetch_item)
+                name = f"{folder}/{msg.uid}"
+
+                # keep only size and date, as there may be many thousands of messages
+                infos[msg.uid] = self._message_info_cache[name] = (
+                    msg.size_rfc822,
+                    msg.date,
+                )
+
+        # the cache may not hold every message of a large listing
+        return {uid: infos[uid] for uid in uids if uid in infos}
+
+    def _cat_many(self, paths: list[str], on_error="raise", **kwargs):
+        # fetch from each folder on its own connection, so round-trips overlap
+        paths_by_message: dict[str, dict[str, list[str]]] = {}
+
+        for path in paths:
+            folder, msg_id, _ = _split_attachment_path(path)
+            folder_paths = paths_by_message.setdefault(folder, {})
+            folder_paths.setdefault(msg_id, []).append(path)
+
+        batches = [
+            batch
+            for folder_paths in paths_by_message.values()
+            for batch in self._split_cat_batches(list(folder_paths.values()))
+        ]
+
+        if not self.connection_pool_size or len(batches) == 1:
+            return self._cat_folder_main(paths, on_error=on_error, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=self.connection_pool_size) as executor:
+            futures = [
+                executor.submit(
+                    self._cat_folder_pooled,
+                    batch,
+                    on_error=on_error,
+                    **kwargs,
+                )
+                for batch in batches
+            ]
+
+        results = {}
+
+        for future in futures:
+            results.update(future.result())
+
+        # keep the order paths were given in
+        return {path: results[path] for path in paths if path in results}
+
+    def _split_cat_batches(self, paths_by_message: list[list[str]]):
+        num_paths = sum(len(msg_paths) for msg_paths in paths_by_message)
+
+        # large folders are split between connections too, keeping the attachments of
+        # each message together so their BODYSTRUCTURE is only fetched once
+        num_batches = max(
+            min(self.connection_pool_size, -(-num_paths // MIN_CAT_BATCH_SIZE)), 1
+        )
+        batches: list[list[str]] = [[] for _ in range(num_batches)]
+
+        for i, msg_paths in enumerate(paths_by_message):
+            batches[i % num_batches].extend(msg_paths)
+
+        return [batch for batch in batches if batch]
+
+    @_retry_on_drop
+    def _cat_folder_main(self, paths: list[str], **kwargs):
+        return self._cat_folder(paths, **kwargs)
+
+    def _cat_folder_pooled(self, paths: list[str], **kwargs):
+        # the pool discards a dropped connection, so retry on another one rather than
+        # reconnecting the main connection from this thread (once every idle connection
+        # has been found dropped, a new one is made)
+        for _ in range(self._pool.max_size):
+            suppress = contextlib.suppress(*CONNECTION_ERRORS)
+
+            with suppress, self._pool.acquire() as mailbox:
+                return self._cat_folder(paths, mailbox=mailbox, **kwargs)
+
+        with self._pool.acquire() as mailbox:
+            return self._cat_folder(paths, mailbox=mailbox, **kwargs)
+
+    def _cat_folder(
+        self,
+        paths: list[str],
+        mailbox: MailBox | None = None,
+        *,
+        on_error: str,
+        start: int | None = None,
+        end: int | None = None,
+        **kwargs,
+    ):
+        fetch_kwargs = _get_fetch_kwargs(kwargs)
+        payloads = self._get_attachment_payloads(paths, mailbox, **fetch_kwargs)
+        out = {}
+
+        for path in paths:
+            payload = payloads[path]
+
+            if not isinstance(payload, Exception):
+                out[path] = payload[start:end]
+            elif on_error == "raise":
+                raise payload
+            elif on_error == "return":
+                out[path] = payload
+
+        return out
+
+    def _get_attachment_payloads(
+        self,
+        paths: list[str],
+        mailbox: MailBox | None = None,
+        **fetch_kwargs,
+    ):
+        mailbox = mailbox or self._main_mailbox
+        payloads: dict[str, bytes | Exception] = {}
+        paths_by_folder: dict[str, dict[str, tuple[str, str]]] = {}
+
+        for path in paths:
+            folder, msg_id, filename = _split_attachment_path(path)
+
+            # anything but a single UID needs a search, so fetch it on its own
+            if folder and msg_id.isdigit() and not fetch_kwargs.get("since"):
+                paths_by_folder.setdefault(folder, {})[path] = (msg_id, filename)
+            else:
+                payloads[path] = self._try_get_attachment_payload(
+                    path,
+                    mailbox,
+                    **fetch_kwargs,
+                )
+
+        for folder, folder_paths in paths_by_folder.items():
+            payloads.update(
+                self._fetch_attachment_payloads(folder, folder_paths, mailbox)
+            )
+
+        return payloads
+
+    def _try_get_attachment_payload(
+        self,
+        path: str,
+        mailbox: MailBox,
+        **fetch_kwargs,
+    ):
+        try:
+            return self._get_attachment_payload(path, mailbox=mailbox, **fetch_kwargs)
+        except CONNECTION_ERRORS:
+            raise
+        except Exception as e:  # noqa: BLE001
+            return e
+
+    def _fetch_attachment_payloads(
+        self,
+        folder: str,
+        paths: dict[str, tuple[str, str]],
+        mailbox: MailBox,
+    ):
+        try:
+            self._select(folder, mailbox)
+            bodystructures = self._cached_bodystructures(
+                folder,
+                list(dict.fromkeys(uid for uid, _ in paths.values())),
+                mailbox,
+            )
+        except IMAP4.abort:
+            raise
+        except (MailboxFolderSelectError, MailboxFetchError, IMAP4.error):
+            return {path: FileNotFoundError(path) for path in paths}
+
+        payloads: dict[str, bytes | Exception] = {}
+        parts = {}
+
+        for path, (uid, filename) in paths.items():
+            payloads[path] = FileNotFoundError(path)
+            attachment_parts = (
+                self._attachment_parts(folder, uid, mailbox)
+                if uid in bodystructures
+                else {}
+            )
+
+            if filename in attachment_parts:
+                parts[path] = (uid, *attachment_parts[filename])
+
+        try:
+            items_by_uid = self._fetch_sections(parts.values(), mailbox)
+        except IMAP4.abort:
+            raise
+        except (MailboxFetchError, IMAP4.error):
+            return payloads
+
+        for path, (uid, section, part) in parts.items():
+            data = items_by_uid.get(uid, {}).get(f"BODY[{section}]")
+
+            if data is not None:
+                payloads[path] = get_part_payload(part, data)
+
+        return payloads
+
+    def _fetch_sections(
+        self,
+        parts: Iterable[tuple[str, str, Message]],
+        mailbox: MailBox,
+    ):
+        # fetch each section from every message that has it in a single command
+        uids_by_section: dict[str, list[str]] = {}
+
+        for uid, section, _ in parts:
+            uids = uids_by_section.setdefault(section, [])
+
+            if uid not in uids:
+                uids.append(uid)
+
+        return self._fetch_pipelined_uids(
+            mailbox.client,
+            [
+                (uid_set, f"(UID BODY.PEEK[{section}])")
+                for section, uids in uids_by_section.items()
+                for uid_set in _chunk_uids(uids)
+            ],
+        )
+
+    def _resolve_uid(self, path: str, mailbox: MailBox | None = None, **fetch_kwargs):
+        mailbox = mailbox or self._main_mailbox
+        criteria = self._get_criteria(
+            path,
+            since=fetch_kwargs.get("since"),
+            attachments_only=False,
+            mailbox=mailbox,
+        )
+        msg_id = self._split_path_last(path)[1]
+
+        # a single UID can be looked up directly, otherwise resolve the first match
+        if msg_id.isdigit() and not fetch_kwargs.get("since"):
+            return msg_id
+
+        uids = mailbox.uids(
+            criteria,
+            fetch_kwargs.get("charset", "US-ASCII"),
+            fetch_kwargs.get("sort"),
+        )
+
+        if fetch_kwargs.get("reverse"):
+            uids.reverse()
+
+        if not uids:
+            raise FileNotFoundError(path)
+
+        return uids[0]
+
+    def _get_attachment_payload(
+        self,
+        path: str,
+        mailbox: MailBox | None = None,
+        **fetch_kwargs,
+    ):
+        mailbox = mailbox or self._main_mailbox
+        _, msg_id, section, part = self._find_attachment_part(
+            path,
+            mailbox,
+            **fetch_kwargs,
+        )
+
+        result = mailbox.client.uid("FETCH", msg_id, f"(BODY.PEEK[{section}])")
+        check_command_status(result, MailboxFetchError)
+
+        for item in _uid_items(result, msg_id):
+            if (data := item.get(f"BODY[{section}]")) is not None:
+                return get_part_payload(part, data)
 
         raise FileNotFoundError(path)
 
-    def _get_attachment(self, path: str, **fetch_kwargs):
+    def _read_attachment(self, path: str, **fetch_kwargs):
         path = path.strip("/")
 
-        if "/" not in path:
-            raise FileNotFoundError(path)
+        with self._prefetch_lock:
+            prefetched, self._prefetched = self._prefetched, None
+
+        payload = None
+
+        if prefetched and prefetched[0] == path and not fetch_kwargs:
+            payload = prefetched[1].result()
+
+        if payload is None:
+            payload = self._get_attachment_payload(path, **fetch_kwargs)
+
+        if not fetch_kwargs:
+            self._prefetch_next_attachment(path)
 
+        return payload
+
+    def _prefetch_next_attachment(self, path: str):
+        if not self.connection_pool_size:
+            return
+
+        # attachments of a message are usually read in turn, so fetch the next one on
+        # a pooled connection while the caller works on this one
         parent, filename = self._split_path_last(path)
-        msg = next(self._get_messages(parent, **fetch_kwargs))
+        filenames = list(self._attachment_parts_cache.get(parent, {}))
 
-        return self._get_attachment_from_message(msg, filename)
+        if filename not in filenames[:-1]:
+            return
 
-    def _get_attachment_from_message(self, msg: MailMessage, filename: str):
-        for att in msg.attachments:
-            att_filename = re.sub(r"[\r\n]", "", att.filename)
+        next_path = f"{parent}/{filenames[filenames.index(filename) + 1]}"
+
+        with self._prefetch_lock:
+            if self._closed.is_set():
+                return
+
+            self._prefetched = (
+                next_path,
+                self._prefetch_executor.submit(self._prefetch_attachment, next_path),
+            )
+
+    def _prefetch_attachment(self, path: str):
+        # anything that goes wrong is left for the caller to run into, if it reads
+        # the attachment after all
+        suppress = contextlib.suppress(
+            IMAP4.error, OSError, MailboxFolderSelectError, MailboxFetchError
+        )
+
+        with suppress, self._pool.acquire() as mailbox:
+            return self._get_attachment_payload(path, mailbox=mailbox)
 
-            if att_filename == filename:
-                return att
+        return None
+
+    def _find_attachment_part(
+        self,
+        path: str,
+        mailbox: MailBox | None = None,
+        **fetch_kwargs,
+    ):
+        mailbox = mailbox or self._main_mailbox
+        folder, msg_id, filename = _split_attachment_path(path)
+
+        if not folder:
+            raise FileNotFoundError(path)
+
+        msg_id = self._resolve_uid(f"{folder}/{msg_id}", mailbox, **fetch_kwargs)
+
+        try:
+            section, part = self._attachment_parts(folder, msg_id, mailbox)[filename]
+        except KeyError as e:
+            raise FileNotFoundError(path) from e
 
-        raise FileNotFoundError(filename)
+        return folder, msg_id, section, part
+
+    @_retry_on_drop
+    def _fetch_attachment_range(self, f: IMAPAttachmentFile, start: int, end: int):
+        if end <= start:
+            return b""
+
+        section = f.attachment.section
+        self._select(f.folder)
+        result = self._main_mailbox.client.uid(
+            "FETCH", f.uid, f"(BINARY.PEEK[{section}]<{start}.{end - start}>)"
+        )
+        check_command_status(result, MailboxFetchError)
+
+        # some servers echo the PEEK in the item name
+        pattern = re.compile(rf"BINARY(?:\.PEEK)?\[{re.escape(section)}\](?:<\d+>)?")
+
+        for item in _uid_items(result, f.uid):
+            for key, value in item.items():
+                if pattern.fullmatch(key):
+                    return value or b""
+
+        raise FileNotFoundError(f.path)
+
+    def _cached_bodystructures(self, folder: str, uids: list[str], mailbox: MailBox):
+        bodystructures = {
+            uid: bodystructure
+            for uid in uids
+            if (bodystructure := self._bodystructure_cache.get(f"{folder}/{uid}"))
+        }
+        missing = [uid for uid in uids if uid not in bodystructures]
+
+        items_by_uid = self._fetch_pipelined_uids(
+            mailbox.client,
+            [(uid_set, "(UID BODYSTRUCTURE)") for uid_set in _chunk_uids(missing)],
+        )
+
+        for uid, item in items_by_uid.items():
+            if "BODYSTRUCTURE" in item:
+                bodystructures[uid] = self._bodystructure_cache[f"{folder}/{uid}"] = (
+                    item["BODYSTRUCTURE"]
+                )
+
+        return {uid: bodystructures[uid] for uid in uids if uid in bodystructures}
+
+    def _attachment_parts(
+        self,
+        folder: str,
+        uid: str,
+        mailbox: MailBox | None = None,
+    ):
+        key = f"{folder}/{uid}"
+
+        if key not in self._attachment_parts_cache:
+            parts: dict[str, tuple[str, Message]] = {}
+            bodystructure = self._cached_bodystructure(folder, uid, mailbox=mailbox)
+
+            # look attachments up by name, keeping the first of any with the same name
+            for section, part in iter_attachment_parts(bodystructure):
+                filename = re.sub(r"[\r\n]", "", MailAttachment(part).filename)
+                parts.setdefault(filename, (section, part))
+
+            self._attachment_parts_cache[key] = parts
+
+        return self._attachment_parts_cache[key]
+
+    def _cached_bodystructure(
+        self,
+        folder: str,
+        uid: str,
+        mailbox: MailBox | None = None,
+    ):
+        mailbox = mailbox or self._main_mailbox
+        key = f"{folder}/{uid}"
+
+        if key not in self._bodystructure_cache:
+            result = mailbox.client.uid("FETCH", uid, "(UID BODYSTRUCTURE)")
+            check_command_status(result, MailboxFetchError)
+
+            for item in parse_fetch_response(result[1]):
+                if "BODYSTRUCTURE" in item:
+                    item_key = f"{folder}/{item['UID'].decode()}"
+                    self._bodystructure_cache[item_key] = item["BODYSTRUCTURE"]
+
+        try:
+            return self._bodystructure_cache[key]
+        except KeyError as e:
+            raise FileNotFoundError(key) from e
+
+    @staticmethod
+    def _split_path_last(path: str) -> tuple[str, str]:
+        parent, _, last = path.rpartition("/")
+        return parent, last
+
+    @staticmethod
+    def _is_subpath(path: str, parent: str) -> bool:
+        return not parent or path == parent or path.startswith(f"{parent}/")
 
     @staticmethod
-    def _split_path_last(path: str) -> list[str]:
-        return path.rsplit("/", 1)
+    def _path_matcher(pattern: str) -> Callable[[str], bool]:
+        # same as `PurePosixPath(path).match(pattern)`, with each part of the pattern
+        # compiled once up front
+        part_matchers = [
+            re.compile(fnmatch.translate(part)).match
+            for part in reversed(pattern.split("/"))
+        ]
+
+        def match(path: str) -> bool:
+            parts = path.split("/")
+
+            if len(part_matchers) > len(parts):
+                return False
+
+            return all(m(part) for m, part in zip(part_matchers, reversed(parts)))
+
+        return match
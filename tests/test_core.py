@@ -1,18 +1,39 @@
 """IMAP filesystem tests."""
 
+import contextlib
 import csv
 import io
 import os
+import socket
+import time
 import uuid
 import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
 from email.message import EmailMessage
-from smtplib import SMTP
+from imaplib import IMAP4, IMAP4_PORT
+from smtplib import SMTP, SMTPServerDisconnected
+from unittest.mock import ANY
 
 import pytest
 from dotenv import load_dotenv
-from imap_tools import MailBox
+from imap_tools import AND, MailBox, MailMessageFlags
+from imap_tools.errors import (
+    MailboxFolderCreateError,
+    MailboxFolderDeleteError,
+    MailboxLoginError,
+    UnexpectedCommandStatusError,
+)
+from imap_tools.folder import encode_folder
+from imap_tools.mailbox import BaseMailBox
+from imap_tools.utils import check_command_status
+from imapfs.bodystructure import (
+    parse_fetch_response,
+    parse_list_response,
+    parse_status_response,
+)
 from imapfs.core import IMAPFileSystem
+from typing_extensions import override
 
 TEST_FOLDER_NAME = f"imapfs-{uuid.uuid4()}"
 TEST_SUBFOLDER_NAME = f"{TEST_FOLDER_NAME}/subfolder"
@@ -26,7 +47,210 @@ INBOX_FOLDER = {"name": INBOX_NAME, "size": 0, "type": "directory"}
 NOW = datetime.now(tz=timezone.utc)
 
 
-load_dotenv()
+class MessageUIDs(dict):
+    """UID of the test message by folder, looked up only once it is not known."""
+
+    def __init__(self, mailbox: MailBox, criteria: str) -> None:
+        super().__init__()
+        self.mailbox = mailbox
+        self.criteria = criteria
+
+    def __missing__(self, folder: str) -> str:
+        self.select(folder, readonly=True)
+        self[folder] = self.mailbox.uids(self.criteria)[0]
+        return self[folder]
+
+    def move(self, folder: str, destination: str) -> str:
+        msg_id = self[folder]
+        del self[folder]
+
+        client = self.mailbox.client
+        self.select(folder)
+        client.untagged_responses.pop("COPYUID", None)
+        self.mailbox.move(msg_id, destination)
+
+        # servers with UIDPLUS report the UID of the moved message, so there is no
+        # need to search for it
+        copyuid = client.untagged_responses.pop("COPYUID", None)
+
+        if copyuid and "UIDPLUS" in client.capabilities:
+            # "<uidvalidity> <source uid set> <destination uid set>"
+            *_, dest_uids = copyuid[-1].decode().split()
+            self[destination] = dest_uids
+            self.select(destination)
+
+        return self[destination]
+
+    def size(self, folder: str) -> int:
+        msg_id = self[folder]
+        self.select(folder, readonly=True)
+        msg = next(self.mailbox.fetch(AND(uid=msg_id), headers_only=True))
+        return msg.size_rfc822
+
+    def select(self, folder: str, *, readonly=False):
+        client = self.mailbox.client
+
+        # skip selecting the folder again between moves, unless only examined before
+        if (
+            client.state == "SELECTED"
+            and self.mailbox.folder.get() == folder
+            and (readonly or not client.is_readonly)
+        ):
+            return
+
+        self.mailbox.folder.set(folder, readonly=readonly)
+
+
+def login_smtp() -> SMTP:
+    host = os.getenv("SMTP_HOST")
+    username = os.getenv("SMTP_USERNAME")
+    password = os.getenv("SMTP_PASSWORD")
+
+    client = SMTP(host, 587)
+    client.starttls()
+    client.login(username, password)
+    return client
+
+
+def message_entry(folder: str, msg_id: str, size: int) -> dict:
+    return {
+        "name": f"{folder}/{msg_id}",
+        "size": size,
+        "type": "directory",
+        "last_modified": ANY,
+    }
+
+
+def path_variants(path: str) -> dict[str, str]:
+    # checked in one test, rather than moving the test message once per variant
+    return {
+        "no leading/trailing slash": path,
+        "leading slash": f"/{path}",
+        "trailing slash": f"{path}/",
+        "leading/trailing slash": f"/{path}/",
+    }
+
+
+def pipeline_commands(mailbox: MailBox, *commands: tuple[str, ...]) -> list[tuple]:
+    # send every command before reading any response, in one round-trip
+    client = mailbox.client
+    tags = [(name, client._command(name, *args)) for name, *args in commands]  # noqa: SLF001
+
+    return [client._command_complete(name, tag) for name, tag in tags]  # noqa: SLF001
+
+
+def pipeline_folder_commands(
+    mailbox: MailBox,
+    command: str,
+    folders: list[str],
+    error_type: type[UnexpectedCommandStatusError],
+):
+    results = pipeline_commands(
+        mailbox, *((command, encode_folder(f)) for f in folders)
+    )
+
+    for result in results:
+        check_command_status(result, error_type)
+
+
+class ScriptedIMAP4(IMAP4):
+    """IMAP client answering commands from a script, rather than from a server."""
+
+    def __init__(self, script: dict[str, list[bytes]], capabilities: str) -> None:
+        # each command is answered by the lines of the first entry it starts with,
+        # then tagged OK unless the last line is a status (e.g. b"BAD ...")
+        self.script = {
+            "CAPABILITY": [f"* CAPABILITY {capabilities}".encode()],
+            **script,
+        }
+        self.sent: list[bytes] = []
+        super().__init__()
+
+    @override
+    def open(self, host="", port=IMAP4_PORT, timeout=None):
+        self.host = host
+        self.port = port
+        self.sock = socket.socket()
+        self._buffer = bytearray(b"* OK ready\r\n")
+
+    @override
+    def read(self, size):
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    @override
+    def readline(self):
+        return self.read(self._buffer.find(b"\n") + 1)
+
+    @override
+    def send(self, data):
+        self.sent.append(data)
+        tag, command = data.rstrip(b"\r\n").split(b" ", 1)
+        lines = next(
+            (v for k, v in self.script.items() if command.startswith(k.encode())),
+            [],
+        )
+
+        if not lines or lines[-1].startswith(b"* "):
+            lines = [*lines, b"OK done"]
+
+        for line in lines[:-1]:
+            self._buffer += line + b"\r\n"
+
+        self._buffer += tag + b" " + lines[-1] + b"\r\n"
+
+    @override
+    def shutdown(self):
+        self.sock.close()
+
+
+class ScriptedMailBox(BaseMailBox):
+    """Mailbox with a scripted client."""
+
+    def __init__(self, script: dict[str, list[bytes]], capabilities: str) -> None:
+        self._script = script
+        self._capabilities = capabilities
+        super().__init__()
+
+    @override
+    def _get_mailbox_client(self):
+        return ScriptedIMAP4(self._script, self._capabilities)
+
+
+def scripted_fs(script: dict[str, list[bytes]], capabilities="IMAP4rev1"):
+    fs = IMAPFileSystem(
+        host="localhost",
+        username="user",
+        password=str(uuid.uuid4()),
+        skip_instance_cache=True,
+        share_connection=False,
+        connection_pool_size=0,
+    )
+    fs.mailbox = ScriptedMailBox(script, capabilities)
+    fs.mailbox.login("user", "password")
+
+    return fs
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _load_dotenv():
+    load_dotenv()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _smtp_login(_load_dotenv):
+    # log in to SMTP in the background, while the IMAP session is set up
+    executor = ThreadPoolExecutor(max_workers=1)
+    login = executor.submit(login_smtp)
+    executor.shutdown(wait=False)
+
+    yield login
+
+    # the connection is idle after the test message is sent, so the server may have
+    # dropped it already
+    with contextlib.suppress(SMTPServerDisconnected):
+        login.result().quit()
 
 
 @pytest.fixture(scope="session")
@@ -38,6 +262,13 @@ def fs():
     )
 
     with fs.mailbox:
+        pipeline_folder_commands(
+            fs.mailbox,
+            "CREATE",
+            [TEST_FOLDER_NAME, TEST_SUBFOLDER_NAME],
+            MailboxFolderCreateError,
+        )
+
         yield fs
 
 
@@ -47,36 +278,26 @@ def imap_mailbox(fs: IMAPFileSystem):
 
 
 @pytest.fixture(scope="session")
-def smtp_client():
-    host = os.getenv("SMTP_HOST")
-    username = os.getenv("SMTP_USERNAME")
-    password = os.getenv("SMTP_PASSWORD")
-
-    with SMTP(host, 587) as client:
-        client.starttls()
-        client.login(username, password)
-        yield client
+def smtp_client(_smtp_login: Future[SMTP]):
+    return _smtp_login.result()
 
 
 @pytest.fixture(scope="session")
 def test_message_search_criteria(smtp_client: SMTP):
-    return "FROM {from_} TO {to} SINCE {since}".format(
+    # the subject is unique to this session, so concurrent sessions (e.g. pytest-xdist
+    # workers) never pick up or delete each other's test messages
+    return 'FROM {from_} TO {to} SINCE {since} SUBJECT "{subject}"'.format(
         from_=smtp_client.user,
         to=os.getenv("IMAP_USERNAME"),
         since=NOW.strftime(r"%d-%b-%Y"),
+        subject=TEST_FOLDER_NAME,
     )
 
 
 @pytest.fixture(scope="session", autouse=True)
-def create_test_folders(imap_mailbox: MailBox):
-    imap_mailbox.folder.create(TEST_FOLDER_NAME)
-    imap_mailbox.folder.create(TEST_SUBFOLDER_NAME)
-
-
-@pytest.fixture(scope="session", autouse=True)
-def send_message(smtp_client: SMTP):
+def send_message(imap_mailbox: MailBox, smtp_client: SMTP):
     msg = EmailMessage()
-    msg["Subject"] = "imapfs test email"
+    msg["Subject"] = f"imapfs test email {TEST_FOLDER_NAME}"
     msg["From"] = smtp_client.user
     msg["To"] = os.getenv("IMAP_USERNAME")
     msg.set_content(TEST_FOLDER_NAME)
@@ -105,18 +326,33 @@ def send_message(smtp_client: SMTP):
             filename=f"test_{i}.csv",
         )
 
-    smtp_client.send_message(msg)
+    # wait for the message to be delivered, so it can be looked up straight away
+    imap_mailbox.folder.set(INBOX_NAME, readonly=True)
+
+    with imap_mailbox.idle as idle:
+        smtp_client.send_message(msg)
+
+        for _ in range(10):
+            if any(r.endswith(b" EXISTS") for r in idle.poll(timeout=3)):
+                break
 
     return msg
 
 
+@pytest.fixture(scope="session")
+def trash_flagged(imap_mailbox: MailBox):
+    folders = imap_mailbox.folder.list()
+    return [f.name for f in folders if r"\Trash" in f.flags]
+
+
 @pytest.fixture(scope="session", autouse=True)
-def delete_test_messages(imap_mailbox: MailBox, test_message_search_criteria):
+def delete_test_messages(
+    imap_mailbox: MailBox,
+    test_message_search_criteria,
+    trash_flagged: list[str],
+):
     yield
 
-    folders = imap_mailbox.folder.list()
-    trash_flagged = [f.name for f in folders if r"\Trash" in f.flags]
-
     imap_mailbox.folder.set(INBOX_NAME)
 
     if (num_trash := len(trash_flagged)) == 1:
@@ -134,41 +370,55 @@ def delete_test_messages(imap_mailbox: MailBox, test_message_search_criteria):
         )
 
     msg_ids = imap_mailbox.uids(test_message_search_criteria)
+    imap_mailbox.flag(msg_ids, MailMessageFlags.DELETED, value=True)
+    imap_mailbox.expunge()
+
+    # neither test folder is selected, so both can be deleted in one round-trip
+    pipeline_folder_commands(
+        imap_mailbox,
+        "DELETE",
+        [TEST_FOLDER_NAME, TEST_SUBFOLDER_NAME],
+        MailboxFolderDeleteError,
+    )
 
-    imap_mailbox.delete(msg_ids)
 
-    imap_mailbox.folder.delete(TEST_FOLDER_NAME)
-    imap_mailbox.folder.delete(TEST_SUBFOLDER_NAME)
+@pytest.fixture(scope="session")
+def test_message_uids(imap_mailbox: MailBox, test_message_search_criteria):
+    return MessageUIDs(imap_mailbox, test_message_search_criteria)
 
 
-@pytest.fixture
-def move_to_test_folder(imap_mailbox: MailBox, test_message_search_criteria):
-    imap_mailbox.folder.set(INBOX_NAME)
-    inbox_msg_id = imap_mailbox.uids(test_message_search_criteria)[0]
-    imap_mailbox.move(inbox_msg_id, TEST_FOLDER_NAME)
+@pytest.fixture(scope="session")
+def test_message_size(test_message_uids: MessageUIDs):
+    # the message is moved between folders unchanged, so its size is the same in each
+    return test_message_uids.size(INBOX_NAME)
+
 
-    imap_mailbox.folder.set(TEST_FOLDER_NAME)
-    folder_msg_id = imap_mailbox.uids(test_message_search_criteria)[0]
+@pytest.fixture
+def move_to_test_folder(
+    fs: IMAPFileSystem,
+    test_message_uids: MessageUIDs,
+):
+    folder_msg_id = test_message_uids.move(INBOX_NAME, TEST_FOLDER_NAME)
+    fs.invalidate_cache()
 
     yield folder_msg_id
 
-    imap_mailbox.folder.set(TEST_FOLDER_NAME)
-    imap_mailbox.move(folder_msg_id, INBOX_NAME)
+    test_message_uids.move(TEST_FOLDER_NAME, INBOX_NAME)
+    fs.invalidate_cache()
 
 
 @pytest.fixture
-def move_to_test_subfolder(imap_mailbox: MailBox, test_message_search_criteria):
-    imap_mailbox.folder.set(INBOX_NAME)
-    inbox_msg_id = imap_mailbox.uids(test_message_search_criteria)[0]
-    imap_mailbox.move(inbox_msg_id, TEST_SUBFOLDER_NAME)
-
-    imap_mailbox.folder.set(TEST_SUBFOLDER_NAME)
-    subfolder_msg_id = imap_mailbox.uids(test_message_search_criteria)[0]
+def move_to_test_subfolder(
+    fs: IMAPFileSystem,
+    test_message_uids: MessageUIDs,
+):
+    subfolder_msg_id = test_message_uids.move(INBOX_NAME, TEST_SUBFOLDER_NAME)
+    fs.invalidate_cache()
 
     yield subfolder_msg_id
 
-    imap_mailbox.folder.set(TEST_SUBFOLDER_NAME)
-    imap_mailbox.move(subfolder_msg_id, INBOX_NAME)
+    test_message_uids.move(TEST_SUBFOLDER_NAME, INBOX_NAME)
+    fs.invalidate_cache()
 
 
 @pytest.mark.parametrize("path", ["", "/"], ids=["empty string", "single slash"])
@@ -179,112 +429,211 @@ def test_ls_root(fs: IMAPFileSystem, path):
     assert TEST_FOLDER in objects
 
 
-@pytest.mark.parametrize(
-    "path",
-    [
-        TEST_FOLDER_NAME,
-        f"/{TEST_FOLDER_NAME}",
-        f"{TEST_FOLDER_NAME}/",
-        f"/{TEST_FOLDER_NAME}/",
-    ],
-    ids=[
-        "no leading/trailing slash",
-        "leading slash",
-        "trailing slash",
-        "leading/trailing slash",
-    ],
-)
-def test_ls_folder(fs: IMAPFileSystem, move_to_test_folder, path):
-    objects = fs.ls(path)
+def test_ls_root_reconnect():
+    fs = IMAPFileSystem(
+        host=os.getenv("IMAP_HOST"),
+        username=os.getenv("IMAP_USERNAME"),
+        password=os.getenv("IMAP_PASSWORD"),
+        skip_instance_cache=True,
+        share_connection=False,
+    )
 
-    assert objects == [
+    fs.mailbox.client.shutdown()
+    objects = fs.ls("")
+    fs.mailbox.logout()
+
+    assert INBOX_FOLDER in objects
+    assert TEST_FOLDER in objects
+
+
+def test_lazy_login():
+    fs = IMAPFileSystem(
+        host=os.getenv("IMAP_HOST"),
+        username=os.getenv("IMAP_USERNAME"),
+        password=str(uuid.uuid4()),
+        skip_instance_cache=True,
+    )
+
+    with pytest.raises(MailboxLoginError):
+        fs.ls("")
+
+
+def test_shared_connection(fs: IMAPFileSystem):
+    other_fs = IMAPFileSystem(
+        host=os.getenv("IMAP_HOST"),
+        username=os.getenv("IMAP_USERNAME"),
+        password=os.getenv("IMAP_PASSWORD"),
+        cache_ttl=0,
+    )
+
+    assert other_fs is not fs
+    assert other_fs.mailbox is fs.mailbox
+
+
+def test_ls_folder(
+    fs: IMAPFileSystem,
+    move_to_test_folder,
+    test_message_size: int,
+):
+    expected = [
         TEST_FOLDER,
         TEST_SUBFOLDER,
-        {
-            "name": f"{TEST_FOLDER_NAME}/{move_to_test_folder}",
-            "size": 0,
-            "type": "directory",
-        },
+        message_entry(TEST_FOLDER_NAME, move_to_test_folder, test_message_size),
     ]
 
+    for variant, path in path_variants(TEST_FOLDER_NAME).items():
+        fs.invalidate_cache()
+        assert fs.ls(path) == expected, variant
+
+
+def test_ls_folder_no_cache(test_message_uids: MessageUIDs):
+    fs = IMAPFileSystem(
+        host=os.getenv("IMAP_HOST"),
+        username=os.getenv("IMAP_USERNAME"),
+        password=os.getenv("IMAP_PASSWORD"),
+        cache_ttl=0,
+        share_connection=False,
+    )
+
+    with fs.mailbox, contextlib.closing(fs):
+        assert fs.ls(TEST_FOLDER_NAME, detail=False) == [
+            TEST_FOLDER_NAME,
+            TEST_SUBFOLDER_NAME,
+        ]
+
+        folder_msg_id = test_message_uids.move(INBOX_NAME, TEST_FOLDER_NAME)
+
+        try:
+            assert fs.ls(TEST_FOLDER_NAME, detail=False) == [
+                TEST_FOLDER_NAME,
+                TEST_SUBFOLDER_NAME,
+                f"{TEST_FOLDER_NAME}/{folder_msg_id}",
+            ]
+        finally:
+            test_message_uids.move(TEST_FOLDER_NAME, INBOX_NAME)
+
+
+def test_ls_folder_idle(test_message_uids: MessageUIDs):
+    fs = IMAPFileSystem(
+        host=os.getenv("IMAP_HOST"),
+        username=os.getenv("IMAP_USERNAME"),
+        password=os.getenv("IMAP_PASSWORD"),
+        cache_ttl=3600,
+        idle=True,
+        skip_instance_cache=True,
+        share_connection=False,
+    )
+
+    with fs.mailbox, contextlib.closing(fs):
+        assert fs.ls(TEST_FOLDER_NAME, detail=False) == [
+            TEST_FOLDER_NAME,
+            TEST_SUBFOLDER_NAME,
+        ]
+
+        folder_msg_id = test_message_uids.move(INBOX_NAME, TEST_FOLDER_NAME)
+
+        try:
+            # the cache is invalidated once the server reports the new message
+            for _ in range(50):
+                objects = fs.ls(TEST_FOLDER_NAME, detail=False)
+
+                if len(objects) > 2:  # noqa: PLR2004
+                    break
 
-def test_ls_folder_glob(fs: IMAPFileSystem, move_to_test_folder):
+                time.sleep(0.1)
+
+            assert objects == [
+                TEST_FOLDER_NAME,
+                TEST_SUBFOLDER_NAME,
+                f"{TEST_FOLDER_NAME}/{folder_msg_id}",
+            ]
+        finally:
+            test_message_uids.move(TEST_FOLDER_NAME, INBOX_NAME)
+
+
+def test_ls_folder_mailbox_writable(fs: IMAPFileSystem, move_to_test_folder):
+    fs.ls(INBOX_NAME)
+    fs.ls(TEST_FOLDER_NAME)
+
+    # folders are examined for listings, but the mailbox is left writable
+    assert not fs.mailbox.client.is_readonly
+
+    fs.mailbox.flag(move_to_test_folder, MailMessageFlags.FLAGGED, value=True)
+    fs.mailbox.flag(move_to_test_folder, MailMessageFlags.FLAGGED, value=False)
+
+
+def test_ls_folder_glob(
+    fs: IMAPFileSystem,
+    move_to_test_folder,
+    test_message_size: int,
+):
     path = f"{TEST_FOLDER_NAME}/*"
     objects = fs.ls(path)
 
     assert objects == [
         TEST_SUBFOLDER,
-        {
-            "name": f"{TEST_FOLDER_NAME}/{move_to_test_folder}",
-            "size": 0,
-            "type": "directory",
-        },
+        message_entry(TEST_FOLDER_NAME, move_to_test_folder, test_message_size),
     ]
 
 
-@pytest.mark.parametrize(
-    "path",
-    [
-        TEST_FOLDER_NAME,
-        f"/{TEST_FOLDER_NAME}",
-        f"{TEST_FOLDER_NAME}/",
-        f"/{TEST_FOLDER_NAME}/",
-    ],
-    ids=[
-        "no leading/trailing slash",
-        "leading slash",
-        "trailing slash",
-        "leading/trailing slash",
-    ],
-)
-def test_ls_folder_no_detail(fs: IMAPFileSystem, move_to_test_folder, path):
-    objects = fs.ls(path, detail=False)
-
-    assert objects == [
+def test_ls_folder_no_detail(fs: IMAPFileSystem, move_to_test_folder):
+    expected = [
         TEST_FOLDER_NAME,
         TEST_SUBFOLDER_NAME,
         f"{TEST_FOLDER_NAME}/{move_to_test_folder}",
     ]
 
+    for variant, path in path_variants(TEST_FOLDER_NAME).items():
+        fs.invalidate_cache()
+        assert fs.ls(path, detail=False) == expected, variant
 
-@pytest.mark.parametrize(
-    "path",
-    [
-        TEST_SUBFOLDER_NAME,
-        f"/{TEST_SUBFOLDER_NAME}",
-        f"{TEST_SUBFOLDER_NAME}/",
-        f"/{TEST_SUBFOLDER_NAME}/",
-    ],
-    ids=[
-        "no leading/trailing slash",
-        "leading slash",
-        "trailing slash",
-        "leading/trailing slash",
-    ],
-)
-def test_ls_subfolder(fs: IMAPFileSystem, move_to_test_subfolder, path):
-    objects = fs.ls(path)
 
-    assert objects == [
+def test_ls_subfolder(
+    fs: IMAPFileSystem,
+    move_to_test_subfolder,
+    test_message_size: int,
+):
+    expected = [
         TEST_SUBFOLDER,
-        {
-            "name": f"{TEST_SUBFOLDER_NAME}/{move_to_test_subfolder}",
-            "size": 0,
-            "type": "directory",
-        },
+        message_entry(TEST_SUBFOLDER_NAME, move_to_test_subfolder, test_message_size),
     ]
 
+    for variant, path in path_variants(TEST_SUBFOLDER_NAME).items():
+        fs.invalidate_cache()
+        assert fs.ls(path) == expected, variant
+
+
+def test_ls_subfolder_enumerated(move_to_test_subfolder):
+    fs = IMAPFileSystem(
+        host=os.getenv("IMAP_HOST"),
+        username=os.getenv("IMAP_USERNAME"),
+        password=os.getenv("IMAP_PASSWORD"),
+        enumerate_subfolders=True,
+        skip_instance_cache=True,
+        share_connection=False,
+    )
+
+    with fs.mailbox, contextlib.closing(fs):
+        assert fs.ls(TEST_FOLDER_NAME, detail=False) == [
+            TEST_FOLDER_NAME,
+            TEST_SUBFOLDER_NAME,
+        ]
+        assert fs.ls(TEST_SUBFOLDER_NAME, detail=False) == [
+            TEST_SUBFOLDER_NAME,
+            f"{TEST_SUBFOLDER_NAME}/{move_to_test_subfolder}",
+        ]
+
 
-def test_ls_subfolder_glob(fs: IMAPFileSystem, move_to_test_subfolder):
+def test_ls_subfolder_glob(
+    fs: IMAPFileSystem,
+    move_to_test_subfolder,
+    test_message_size: int,
+):
     path = f"{TEST_SUBFOLDER_NAME}/*"
     objects = fs.ls(path)
 
     assert objects == [
-        {
-            "name": f"{TEST_SUBFOLDER_NAME}/{move_to_test_subfolder}",
-            "size": 0,
-            "type": "directory",
-        },
+        message_entry(TEST_SUBFOLDER_NAME, move_to_test_subfolder, test_message_size),
     ]
 
 
@@ -384,6 +733,19 @@ def test_ls_folder_message_no_detail(fs: IMAPFileSystem, move_to_test_folder):
     assert objects == [f"{path}/test_0.csv", f"{path}/test_1.csv", f"{path}/test_2.csv"]
 
 
+def test_ls_folder_message_details(fs: IMAPFileSystem, move_to_test_folder):
+    path = f"{TEST_FOLDER_NAME}/{move_to_test_folder}"
+    objects = fs.ls(TEST_FOLDER_NAME)
+    actual = next(o for o in objects if o["name"] == path)
+
+    assert actual.keys() == {"name", "size", "type", "last_modified"}
+    assert actual["size"] > 0
+    assert actual["type"] == "directory"
+    assert isinstance(actual["last_modified"], datetime)
+    assert actual["last_modified"].date() == NOW.date()
+    assert fs.created(path) == actual["last_modified"]
+
+
 def test_ls_subfolder_message(
     fs: IMAPFileSystem,
     send_message: EmailMessage,
@@ -573,6 +935,31 @@ def test_ls_folder_message_glob_attachment(
         next(expected_actual)
 
 
+def test_glob_folder_message_attachment(fs: IMAPFileSystem, move_to_test_folder):
+    path = f"{TEST_FOLDER_NAME}/*/test_*.csv"
+    paths = fs.glob(path)
+
+    assert paths == [
+        f"{TEST_FOLDER_NAME}/{move_to_test_folder}/test_0.csv",
+        f"{TEST_FOLDER_NAME}/{move_to_test_folder}/test_1.csv",
+        f"{TEST_FOLDER_NAME}/{move_to_test_folder}/test_2.csv",
+    ]
+
+
+def test_glob_subfolder_message_partial_wildcard(
+    fs: IMAPFileSystem,
+    move_to_test_subfolder,
+):
+    path = f"{TEST_SUBFOLDER_NAME}/{move_to_test_subfolder[0]}*/test_*.csv"
+    paths = fs.glob(path)
+
+    assert paths == [
+        f"{TEST_SUBFOLDER_NAME}/{move_to_test_subfolder}/test_0.csv",
+        f"{TEST_SUBFOLDER_NAME}/{move_to_test_subfolder}/test_1.csv",
+        f"{TEST_SUBFOLDER_NAME}/{move_to_test_subfolder}/test_2.csv",
+    ]
+
+
 def test_ls_subfolder_message_attachment(
     fs: IMAPFileSystem,
     send_message: EmailMessage,
@@ -681,6 +1068,28 @@ def test_cat_subfolder_message_attachment(fs: IMAPFileSystem, move_to_test_subfo
     ]
 
 
+def test_cat_folder_message_attachments(fs: IMAPFileSystem, move_to_test_folder):
+    path = f"{TEST_FOLDER_NAME}/{move_to_test_folder}/*.csv"
+    contents = fs.cat(path)
+
+    assert list(contents) == [
+        f"{TEST_FOLDER_NAME}/{move_to_test_folder}/test_0.csv",
+        f"{TEST_FOLDER_NAME}/{move_to_test_folder}/test_1.csv",
+        f"{TEST_FOLDER_NAME}/{move_to_test_folder}/test_2.csv",
+    ]
+
+    for content in contents.values():
+        rows = list(csv.DictReader(io.TextIOWrapper(io.BytesIO(content))))
+
+        assert rows == [
+            {"id": "0", "name": "user0", "email": "user0@test.com"},
+            {"id": "1", "name": "user1", "email": "user1@test.com"},
+            {"id": "2", "name": "user2", "email": "user2@test.com"},
+            {"id": "3", "name": "user3", "email": "user3@test.com"},
+            {"id": "4", "name": "user4", "email": "user4@test.com"},
+        ]
+
+
 def test_cat_folder_message_attachment_not_found(
     fs: IMAPFileSystem,
     move_to_test_folder,
@@ -719,6 +1128,19 @@ def test_read_text_folder_message_attachment(fs: IMAPFileSystem, move_to_test_fo
     ]
 
 
+def test_open_folder_message_attachment_seek(fs: IMAPFileSystem, move_to_test_folder):
+    path = f"{TEST_FOLDER_NAME}/{move_to_test_folder}/test_0.csv"
+    content = fs.cat(path)
+
+    with fs.open(path, block_size=8) as f:
+        assert f.size == len(content)
+        assert f.read(5) == content[:5]
+
+        f.seek(-10, os.SEEK_END)
+
+        assert f.read() == content[-10:]
+
+
 @pytest.mark.parametrize(
     "path",
     [
@@ -810,3 +1232,183 @@ def test_modified_folder_message(fs: IMAPFileSystem, move_to_test_folder):
     created = fs.created(path)
 
     assert modified == created
+
+
+def test_modified_folder_message_attachment(fs: IMAPFileSystem, move_to_test_folder):
+    path = f"{TEST_FOLDER_NAME}/{move_to_test_folder}/test_0.csv"
+    modified = fs.modified(path)
+
+    assert modified.date() == NOW.date()
+
+    created = fs.created(path)
+
+    assert modified == created
+
+
+def test_parse_list_response():
+    data = [
+        b'(\\HasNoChildren) "/" INBOX',
+        b'(\\HasChildren \\Noselect) "/" "[Gmail]"',
+        b'(\\HasNoChildren \\Junk) "/" [Gmail]/Spam',
+        b'(\\HasNoChildren) "/" "quoted \\"name\\""',
+        (b'() "/" {12}', b"Inbox/Drafts"),
+        b"",
+        b"() NIL &AOk-t&AOk-",
+    ]
+
+    folders = parse_list_response(data)
+
+    assert [(f.name, f.delim, f.flags) for f in folders] == [
+        ("INBOX", "/", ("\\HasNoChildren",)),
+        ("[Gmail]", "/", ("\\HasChildren", "\\Noselect")),
+        ("[Gmail]/Spam", "/", ("\\HasNoChildren", "\\Junk")),
+        ('quoted "name"', "/", ("\\HasNoChildren",)),
+        ("Inbox/Drafts", "/", ()),
+        ("\u00e9t\u00e9", "", ()),
+    ]
+
+
+def test_parse_status_response():
+    data = [
+        b"INBOX (MESSAGES 3 UIDNEXT 12 UIDVALIDITY 1)",
+        b'"Sent Items" (messages 0 uidnext 1 uidvalidity 2)',
+        (b"{5}", b"Notes"),
+        b" (MESSAGES 1)",
+        b"&AOk-t&AOk- (UIDNEXT 4)",
+    ]
+
+    assert parse_status_response(data) == {
+        "INBOX": {"MESSAGES": 3, "UIDNEXT": 12, "UIDVALIDITY": 1},
+        "Sent Items": {"MESSAGES": 0, "UIDNEXT": 1, "UIDVALIDITY": 2},
+        "Notes": {"MESSAGES": 1},
+        "\u00e9t\u00e9": {"UIDNEXT": 4},
+    }
+
+
+def test_parse_fetch_response():
+    data = [
+        (
+            b"1 (UID 5 RFC822.SIZE 120 BODY[HEADER.FIELDS (DATE)] {10}",
+            b"Date: x\r\n\r\n",
+        ),
+        b" BINARY.SIZE[2] 45)",
+        b'2 (UID 6 BODYSTRUCTURE ("text" "plain" NIL NIL NIL "7bit" 3 1 NIL NIL NIL))',
+    ]
+
+    assert parse_fetch_response(data) == [
+        {
+            "UID": b"5",
+            "RFC822.SIZE": b"120",
+            "BODY[HEADER.FIELDS (DATE)]": b"Date: x\r\n\r\n",
+            "BINARY.SIZE[2]": b"45",
+        },
+        {
+            "UID": b"6",
+            "BODYSTRUCTURE": [
+                b"text",
+                b"plain",
+                None,
+                None,
+                None,
+                b"7bit",
+                b"3",
+                b"1",
+                None,
+                None,
+                None,
+            ],
+        },
+    ]
+
+
+def test_ls_root_list_status():
+    fs = scripted_fs(
+        {
+            "LIST": [
+                b'* LIST (\\HasNoChildren) "/" INBOX',
+                b'* LIST (\\HasNoChildren) "/" "[Gmail]/All Mail"',
+                b"* STATUS INBOX (MESSAGES 1 UIDNEXT 2 UIDVALIDITY 3)",
+                b'* STATUS "[Gmail]/All Mail" (MESSAGES 0 UIDNEXT 1 UIDVALIDITY 3)',
+            ],
+        },
+        capabilities="IMAP4rev1 LIST-STATUS",
+    )
+
+    assert fs.ls("", detail=False) == ["INBOX", "[Gmail]/All Mail"]
+    assert fs.mailbox.client.sent[-1].endswith(
+        b'LIST "" "*" RETURN (STATUS (MESSAGES UIDNEXT UIDVALIDITY))\r\n'
+    )
+
+
+def test_ls_root_list_status_rejected():
+    fs = scripted_fs(
+        {
+            'LIST "" "*" RETURN': [b"BAD unknown LIST option"],
+            "LIST": [b'* LIST (\\HasNoChildren) "/" INBOX'],
+        },
+        capabilities="IMAP4rev1 LIST-STATUS",
+    )
+
+    assert fs.ls("", detail=False) == ["INBOX"]
+
+
+def test_ls_message_searchres():
+    message = (
+        b"Content-Type: multipart/mixed; boundary=b\r\n\r\n"
+        b"--b\r\nContent-Type: text/plain\r\n\r\ntest\r\n"
+        b"--b\r\nContent-Type: text/csv\r\n"
+        b'Content-Disposition: attachment; filename="test_0.csv"\r\n\r\na,b\r\n'
+        b"--b--\r\n"
+    )
+    fs = scripted_fs(
+        {
+            'LIST "INBOX/5"': [],
+            'EXAMINE "INBOX/5"': [b"NO no such folder"],
+            "LIST": [b'* LIST (\\HasNoChildren) "/" INBOX'],
+            "EXAMINE": [
+                b"* 1 EXISTS",
+                b"* OK [UIDVALIDITY 1] UIDs valid",
+                b"* OK [UIDNEXT 6] next UID",
+            ],
+            "UID FETCH $": [
+                b"* 1 FETCH (UID 5 FLAGS () RFC822.SIZE %d BODY[] {%d}\r\n%s)"
+                % (len(message), len(message), message)
+            ],
+        },
+        capabilities="IMAP4rev1 SEARCHRES",
+    )
+
+    client = fs.mailbox.client
+
+    assert fs.ls("INBOX/5", detail=False) == ["INBOX/5/test_0.csv"]
+
+    # the search result is saved on the server and fetched from, in one round-trip
+    search, fetch = client.sent[-2:]
+
+    assert b" UID SEARCH RETURN (SAVE) " in search
+    assert b" UID FETCH $ " in fetch
+
+
+def test_fetch_pipelined_uids_error():
+    fs = scripted_fs(
+        {
+            "UID FETCH 5 ": [b"* 1 FETCH (UID 5 BODY[1] {2}\r\nhi)"],
+            "UID FETCH 6 ": [b"BAD unknown fetch item"],
+            "UID FETCH 7 ": [b"* 3 FETCH (UID 7 BODY[1] {2}\r\nyo)"],
+        }
+    )
+    client = fs.mailbox.client
+
+    with pytest.raises(IMAP4.error):
+        fs._fetch_pipelined_uids(  # noqa: SLF001
+            client,
+            [
+                ("5", "(UID BODY.PEEK[1])"),
+                ("6", "(UID BOGUS)"),
+                ("7", "(UID BODY.PEEK[1])"),
+            ],
+        )
+
+    # every response is read, so none is left for the next command to pick up
+    assert not client.tagged_commands
+    assert "FETCH" not in client.untagged_responses